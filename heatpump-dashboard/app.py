@@ -10,35 +10,31 @@ Plotnine documentation for the plotting functions used in this dashboard, and
 ipyleaflet documentation for the map widget used in this dashboard.
 """
 
-from shiny import App, Inputs, Outputs, Session, render, ui, reactive
+from shiny import App, Inputs, Outputs, Session, render, ui, reactive, req
 from shiny.types import NavSetArg
-from ipyleaflet import GeoJSON, Map, Marker 
-from shinywidgets import output_widget, render_widget 
-import pandas as pd
-import openmeteo_requests
-from retry_requests import retry
-import requests_cache
-from plotnine import ggplot, aes, geom_point, theme, element_text, labs, scale_x_datetime, element_line, element_rect, geom_hline, geom_line, scale_color_manual
-from mizani.breaks import date_breaks
-from mizani.formatters import date_format
-from prophet import Prophet
-import matplotlib.pyplot as plt
-
-
-cache_session = requests_cache.CachedSession('.cache', expire_after = -1)
-retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-openmeteo = openmeteo_requests.Client(session = retry_session)
-
-url = "https://archive-api.open-meteo.com/v1/archive"
-
-cities_list = pd.read_csv("data/cities.csv")["city_state"].tolist()
+from shinywidgets import output_widget, render_widget, reactive_read
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+from weather import fetch_daily_async, fetch_hourly_async, to_units
+from forecast import FORECAST_COLUMNS, MAX_YEARS, get_forecast, plot_forecast
+from plots import PLOT_RENDERER, hist_plot, hourly_figure, render_png
+from render_cache import fingerprint, plot_cache
+from reactive_utils import debounce
+from exceedance import sort_temperatures, exceedance_table, hourly_histogram, hourly_exceedance_table
+from cities import CityCatalog
+from warmup import start_warm_up
+from metrics import metrics_endpoint, sessions_endpoint, track_session, traced
+
+
+city_catalog = CityCatalog.load()
+cities_list = city_catalog.names
 
 def navControls():
     """A function to create the navigation controls present in the navbar for the dashboard. This function returns a list of UI elements that are used to create the navbar and is modified based off on the documentation provided by the Shiny library: https://shiny.posit.co/py/api/core/ui.nav_panel.html#shiny.ui.nav_panel"""
 
     return [
-        ui.nav_panel("Historical",ui.output_plot("getHistPlot"),ui.tags.hr(),ui.output_data_frame("getHistTable")),
-        ui.nav_panel("Forecast",ui.output_plot("getForecastPlot"),ui.tags.hr(),ui.output_data_frame("getForecastTable")),
+        ui.nav_panel("Historical",ui.output_image("getHistPlot"),ui.tags.hr(),ui.output_data_frame("getHistTable")),
+        ui.nav_panel("Forecast",ui.output_image("getForecastPlot"),ui.tags.hr(),ui.output_data_frame("getForecastTable")),
         ui.nav_panel("About",ui.markdown("""                           
         Welcome to the **Heat Pump Efficiency Counter**, an interactive dashboard designed to demystify the process of selecting the best heating solutions, tailored specifically according to the local climate conditions in the United States.
         
@@ -59,13 +55,14 @@ def navControls():
         3. <ins>Temperature Preferences</ins>:
                                          
             - **Temperature Units**: Choose your preferred temperature units (Fahrenheit or Celsius) using the radio buttons provided. The dashboard will automatically update data visualizations to reflect your choice.
+            - **Resolution**: Choose between daily minimum temperatures and hourly temperatures for the historical plot and table. In the hourly mode the table counts the hours below each temperature and the heating degree hours, the sum of how far each of those hours fell below it. The forecast is always based on the daily data.
             - **Temperature Threshold for Analysis**: Use the slider to set a specific temperature threshold that is of interest to you. This feature is crucial for visualizing how often temperatures fall above or below this threshold, providing insights into heat pump performance under varying temperature conditions.
             - **Adjusting Temperature Ranges**: Utilize the temperature range slider in the sidebar to filter the data table based on temperatures of interest. This functionality facilitates a detailed analysis of temperature distributions over your selected period, enabling a nuanced understanding of local climate patterns relevant to heat pump efficiency.
                        
         4. <ins>Plotting Options</ins>:
                                          
             - **Historical**: Navigate to the "Historical" tab to view a plot and table showing the historical weather data for your selected location and date range. The plot provides a visual representation of daily minimum temperatures, while the table summarizes the proportion of days falling within specified temperature ranges.You can also opt to display weekly or monthly rolling averages for a more comprehensive view. 
-            - **Forecast**: Navigate to the "Forecast" tab to view a plot and table showing the predicted future temperature trends based on the historical data. You can adjust the forecast trend to be either flat or linear and specify the number of years you want to forecast in the years to forecast tab in the sidebar. The forecast plot and table will update based on your inputs, providing a prediction of future weather patterns and their implications for heat pump performance in your selected location.
+            - **Forecast**: Navigate to the "Forecast" tab to view a plot and table showing the predicted future temperature trends based on the historical data. You can adjust the forecast trend to be either flat or linear and specify the number of years you want to forecast in the years to forecast tab in the sidebar. You can also choose the forecast model: Prophet, or a harmonic regression of the yearly temperature cycle that is much faster to compute. The forecast plot and table will update based on your inputs, providing a prediction of future weather patterns and their implications for heat pump performance in your selected location.
                                          
         **How to run the code:**
         
@@ -106,7 +103,9 @@ app_ui = ui.page_sidebar(
         ui.input_date_range("dateRange", "Dates",start="2022-01-01",end="2024-01-01",min="2020-01-01",max="2024-01-01"),
         ui.input_numeric("yearsForecast", "Years to Forecast", min=1,max=5,value=1),
         ui.input_radio_buttons("getForecastPlot", "Forecast Trend", {"flat": "Flat", "linear": "Linear"}),
+        ui.input_radio_buttons("forecastEngine", "Forecast Model", {"prophet": "Prophet", "harmonic": "Harmonic Regression"}),
         ui.input_radio_buttons("units", "Units", {"F": "Fahrenheit", "C": "Celsius"}),
+        ui.input_radio_buttons("resolution", "Resolution", {"daily": "Daily", "hourly": "Hourly"}),
         ui.output_ui("plotTemperature"),
         ui.input_checkbox("weeklyAvg", "Weekly Rolling Average", False),
         ui.input_checkbox("monthlyAvg", "Monthly Rolling Average", False),
@@ -136,8 +135,12 @@ app_ui = ui.page_sidebar(
 
 def server(input, output, session):
 
+    start_warm_up()
+    track_session(session)
+
     @output
     @render.ui()
+    @traced
     def plotTemperature():
         """A function to create a dynamic slider based on the selected temperature units."""
         units = input.units()
@@ -149,6 +152,7 @@ def server(input, output, session):
     
     @output
     @render.ui()
+    @traced
     def tableTemperatureRange():
         """A function to create a dynamic slider based on the selected temperature range."""
         units = input.units()
@@ -158,268 +162,278 @@ def server(input, output, session):
             return ui.input_slider("tableTemperature", "Table Temperatures", -25, 60, [0, 15], step=1)
         
     
+    @debounce(0.3)
+    def plotThreshold():
+        """A function to debounce the plot temperature slider, so a drag only redraws the plots once."""
+
+        return input.plotTemperature()
+
+    @debounce(0.3)
+    def tableRange():
+        """A function to debounce the table temperature slider, so a drag only recomputes the tables once."""
+
+        return input.tableTemperature()
+
     @reactive.Calc()
+    def getCityCoordinates():
+        """A function to look up the coordinates of the selected city. While the city box holds no known city, for example while the user is typing, nothing depending on it runs."""
+
+        req(str(input.city()) in city_catalog)
+        return city_catalog.coordinates(str(input.city()))
+
+    @reactive.extended_task
+    @traced
+    async def loadWeather(lat, lng, start_date, end_date):
+        """A function to load the daily weather data off the event loop, so a slow or retrying download does not hold up the other sessions. While it runs, the outputs show their pending state."""
+
+        return await fetch_daily_async(lat, lng, start_date, end_date)
+
+    @reactive.Effect(priority=2)
+    def startWeather():
+        """A function to start loading the daily weather data whenever the city or date range change. A load still running for a previous selection is cancelled first."""
+
+        loadWeather.cancel()
+        lat, lng = getCityCoordinates()
+        loadWeather(lat, lng, input.dateRange()[0], input.dateRange()[1])
+
+    @reactive.extended_task
+    @traced
+    async def loadHourly(lat, lng, start_date, end_date):
+        """A function to load the hourly weather data off the event loop, like `loadWeather`."""
+
+        return await fetch_hourly_async(lat, lng, start_date, end_date)
+
+    @reactive.Effect(priority=2)
+    def startHourly():
+        """A function to start loading the hourly weather data whenever the city or date range change in the hourly mode. Nothing is loaded in the daily mode."""
+
+        loadHourly.cancel()
+        if input.resolution() != "hourly":
+            return
+
+        lat, lng = getCityCoordinates()
+        loadHourly(lat, lng, input.dateRange()[0], input.dateRange()[1])
+
+    @reactive.Calc()
+    @traced
+    def getWeather():
+        """A function to return the loaded daily weather data for the selected city and date range. The data is shared by every output and does not depend on the selected units."""
+
+        return loadWeather.result()
+
+    @reactive.Calc()
+    @traced
+    def getDailyData():
+        """A function to convert the shared daily weather data to the selected temperature units."""
+
+        return to_units(getWeather().daily, input.units())
+
+    @reactive.Calc()
+    @traced
     def getCoords():
         """A function to retrieve the latitude and longitude coordinates of the selected city."""
 
-        df = pd.read_csv("data/cities.csv")
-        city_data = df[df['city_state'] == str(input.city())]
-        lat = city_data['lat'].values[0]
-        lng = city_data['lng'].values[0]
-    
-        params = {
-	    "latitude": lat,
-        "longitude": lng,
-        "start_date": input.dateRange()[0],
-        "end_date": input.dateRange()[1],
-        "daily": "temperature_2m_min",
-        "temperature_unit": "fahrenheit" if input.units() == "F" else "celsius",
-        }
-
-        responses = openmeteo.weather_api(url, params=params)
-        response = responses[0]
-        lat = response.Latitude()
-        lng = response.Longitude()
-        ans = "{:.4f}°N, {:.4f}°E".format(lat, lng)
+        weather = getWeather()
+        ans = "{:.4f}°N, {:.4f}°E".format(weather.latitude, weather.longitude)
         return ans
     
+    @reactive.Calc()
+    @traced
+    def getSortedTemps():
+        """A function to sort the daily minimum temperatures once, so the historical table can answer any temperature range without rescanning the data."""
+
+        return sort_temperatures(getDailyData()['temperature_2m_min'])
+
+    @reactive.Calc()
+    @traced
+    def getHourly():
+        """A function to return the loaded hourly weather data for the selected city and date range, in Celsius."""
+
+        return loadHourly.result()
+
+    @reactive.Calc()
+    @traced
+    def getHourlyHistogram():
+        """A function to bin the hourly temperatures in the selected units in one streaming pass, so the hourly table can answer any temperature range from the bins."""
+
+        return hourly_histogram(getHourly().temperature, input.units())
+
     @render.data_frame()
+    @traced
     def getHistTable():
-        """A function to retrieve the historical weather tabular data for the selected city and temperature range."""
+        """A function to retrieve the historical weather tabular data for the selected city and temperature range: days below each temperature, or in the hourly mode hours below and heating degree hours."""
 
-        startTemp = input.tableTemperature()[0]
-        endTemp = input.tableTemperature()[1]
+        if input.resolution() == "hourly":
+            table_df = hourly_exceedance_table(getHourlyHistogram(), tableRange()[0], tableRange()[1])
+        else:
+            table_df = exceedance_table(getSortedTemps(), tableRange()[0], tableRange()[1])
 
-        table = []
+        return render.DataGrid(table_df,width="100%",height='fit-content')
 
-        df = pd.read_csv("data/cities.csv")
-        city_data = df[df['city_state'] == str(input.city())]
-        lat = city_data['lat'].values[0]
-        lng = city_data['lng'].values[0]
-    
-        params = {
-	    "latitude": lat,
-        "longitude": lng,
-        "start_date": input.dateRange()[0],
-        "end_date": input.dateRange()[1],
-        "daily": "temperature_2m_min",
-        "temperature_unit": "fahrenheit" if input.units() == "F" else "celsius",
-        }
-
-        responses = openmeteo.weather_api(url, params=params)
-        response = responses[0]
-        daily = response.Daily()
-        daily_temperature_2m_min = daily.Variables(0).ValuesAsNumpy()
-
-        daily_data = {"date": pd.date_range(
-            start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-            end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-            freq = pd.Timedelta(seconds=daily.Interval()),
-            inclusive = "left"
-        )}
-        
-        daily_data["temperature_2m_min"] = daily_temperature_2m_min
 
-        daily_dataframe = pd.DataFrame(data = daily_data)
-        daily_dataframe['date'] = daily_dataframe['date'].dt.date
+    @reactive.Calc()
+    @traced
+    def getRollingAverages():
+        """A function to calculate the weekly and monthly rolling averages of the daily data. These only change with the data, so toggling the rolling average checkboxes just redraws the plot."""
+
+        daily_dataframe = getDailyData().copy()
+        daily_dataframe['weekly_avg'] = daily_dataframe['temperature_2m_min'].rolling(window=7).mean()
+        daily_dataframe['monthly_avg'] = daily_dataframe['temperature_2m_min'].rolling(window=30).mean()
+        return daily_dataframe
 
-        for t in range(endTemp, startTemp-1, -1):
-            days_below = daily_dataframe[daily_dataframe['temperature_2m_min'] < t].shape[0]
-            proportin_below = days_below / daily_dataframe.shape[0]
-            table.append({"Temp": t, "Days Below": days_below, "Proportion Below": round(proportin_below,3)})
+    def plotSize(name):
+        """A function to read the size of a plot output in CSS pixels and the device pixel ratio of the browser, which the cached renderings are keyed on."""
 
-        table_df = pd.DataFrame(table)
+        width = input[".clientdata_output_{}_width".format(name)]()
+        height = input[".clientdata_output_{}_height".format(name)]()
+        return int(width), int(height), float(input[".clientdata_pixelratio"]())
 
-        return render.DataGrid(table_df,width="100%",height='fit-content')
+    @reactive.Calc()
+    @traced
+    def getDataFingerprint():
+        """A function to fingerprint the daily data in the selected units, so sessions looking at the same city and dates share the cached historical plots."""
 
+        return fingerprint(getDailyData()['temperature_2m_min'])
 
-    @render.plot()
-    def getHistPlot():
-        """A function to retrieve the historical weather plot for the selected city for a specific date range and threshold temperature. Also calculates weekly and monthly rolling averages if selected."""
+    @reactive.Calc()
+    @traced
+    def getHourlyFingerprint():
+        """A function to fingerprint the hourly data, so sessions looking at the same city and dates share the cached hourly plots."""
 
-        df = pd.read_csv("data/cities.csv")
-        city_data = df[df['city_state'] == str(input.city())]
-        lat = city_data['lat'].values[0]
-        lng = city_data['lng'].values[0]
+        return fingerprint(getHourly().temperature)
+
+    @render.image(delete_file=True)
+    @traced
+    def getHistPlot():
+        """A function to retrieve the historical weather plot for the selected city for a specific date range and threshold temperature. Also shows the weekly and monthly rolling averages if selected. Renderings are looked up in the shared plot cache first."""
+
+        width, height, pixelratio = plotSize("getHistPlot")
+        threshold = plotThreshold()
+        if input.resolution() == "hourly":
+            key = ("hourly", getHourlyFingerprint(), input.dateRange()[0], input.units(), threshold, input.weeklyAvg(), input.monthlyAvg(), width, height, pixelratio)
+            path = plot_cache.get(key)
+            if path is None:
+                p = hourly_figure(getHourly(), threshold, input.units(), input.weeklyAvg(), input.monthlyAvg(), max_points=width)
+                path = plot_cache.put(key, render_png(p, width, height, pixelratio))
+            return {"src": path, "width": "100%", "height": "100%", "alt": "Hourly temperatures"}
+
+        key = ("hist", PLOT_RENDERER, getDataFingerprint(), input.dateRange()[0], input.units(), threshold, input.weeklyAvg(), input.monthlyAvg(), width, height, pixelratio)
+
+        path = plot_cache.get(key)
+        if path is None:
+            p = hist_plot(getRollingAverages(), threshold, input.units(), input.weeklyAvg(), input.monthlyAvg(), width)
+            path = plot_cache.put(key, render_png(p, width, height, pixelratio))
+
+        return {"src": path, "width": "100%", "height": "100%", "alt": "Daily minimum temperatures"}
     
-        params = {
-	    "latitude": lat,
-        "longitude": lng,
-        "start_date": input.dateRange()[0],
-        "end_date": input.dateRange()[1],
-        "daily": "temperature_2m_min",
-        "temperature_unit": "fahrenheit" if input.units() == "F" else "celsius",
-        }
-
-        responses = openmeteo.weather_api(url, params=params)
-        response = responses[0]
-        daily = response.Daily()
-        daily_temperature_2m_min = daily.Variables(0).ValuesAsNumpy()
-
-        daily_data = {"date": pd.date_range(
-            start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-            end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-            freq = pd.Timedelta(seconds=daily.Interval()),
-            inclusive = "left"
-        )}
-        
-        daily_data["temperature_2m_min"] = daily_temperature_2m_min
+    @reactive.Calc()
+    def getYearsForecast():
+        """A function to read the years to forecast, clamped to the 1 to 5 years the input offers, since typed values are not limited. While the box is empty nothing depending on it runs."""
 
-        daily_dataframe = pd.DataFrame(data = daily_data)
-        daily_dataframe['date'] = daily_dataframe['date'].dt.date
+        req(input.yearsForecast() is not None)
+        return min(max(int(input.yearsForecast()), 1), MAX_YEARS)
 
-        threshold = input.plotTemperature()
-        daily_dataframe['temp_category'] = ['below' if x < threshold else 'above' for x in daily_dataframe['temperature_2m_min']]
+    @reactive.extended_task
+    @traced
+    async def fitForecast(history, lat, lng, start_date, end_date, growth, years, units, engine):
+        """A function to fit the forecast for the current selection, in the shared process pool for Prophet. While it runs, the forecast outputs show their pending state."""
 
-        
-        p = (
-            ggplot(daily_dataframe, aes(x='date', y='temperature_2m_min', color='temp_category'))
-            + geom_point(alpha=0.9)
-            + labs(title='', x='', y='Daily Minimum Temperature °'+input.units())
-            +scale_x_datetime(
-            breaks=date_breaks('3 months'),  
-            labels=date_format('%Y-%m'))
-            +scale_color_manual(values={'below': '#D3D3D3', 'above': 'black'})
-            + theme(
-            panel_background=element_rect(fill='white', colour='white'),
-            panel_border=element_rect(colour='#9E9E9E', fill=None, size=1),
-            plot_background=element_rect(color='white', size=2),
-            panel_grid_major=element_line(color='lightgrey', size=0.5),
-            legend_position="none"
-            )
-            +geom_hline(yintercept=input.plotTemperature(), color="#A9A9A9", size=0.5)
-
-        )
-
-        if input.weeklyAvg():
-            daily_dataframe['weekly_avg'] = daily_dataframe['temperature_2m_min'].rolling(window=7).mean()
-            p += geom_line(aes(y='weekly_avg',group=1),color="#FF8C00",size=0.9)
-
-        if input.monthlyAvg():
-            daily_dataframe['monthly_avg'] = daily_dataframe['temperature_2m_min'].rolling(window=30).mean()
-            p += geom_line(aes(y='monthly_avg',group=1),color="#1C90FF",size=0.9)
-
-        return p
-    
-    @render.plot()
-    def getForecastPlot():
-        """A function to retrieve the forecasted weather plot for the selected city for a specific date range and threshold temperature. Also calculates weekly and monthly rolling averages if selected."""
+        return await get_forecast(history, lat, lng, start_date, end_date, growth, years, units, engine)
 
-        df = pd.read_csv("data/cities.csv")
-        city_data = df[df['city_state'] == str(input.city())]
-        lat = city_data['lat'].values[0]
-        lng = city_data['lng'].values[0]
-    
-        params = {
-	    "latitude": lat,
-        "longitude": lng,
-        "start_date": input.dateRange()[0],
-        "end_date": input.dateRange()[1],
-        "daily": "temperature_2m_min",
-        "temperature_unit": "fahrenheit" if input.units() == "F" else "celsius",
-        }
-
-        responses = openmeteo.weather_api(url, params=params)
-        response = responses[0]
-        daily = response.Daily()
-        daily_temperature_2m_min = daily.Variables(0).ValuesAsNumpy()
-
-        daily_data = {"date": pd.date_range(
-            start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-            end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-            freq = pd.Timedelta(seconds=daily.Interval()),
-            inclusive = "left"
-        )}
-        
-        daily_data["temperature_2m_min"] = daily_temperature_2m_min
+    @reactive.Effect(priority=1)
+    def startForecast():
+        """A function to start a forecast fit whenever the city, date range, growth, horizon, units or model change while the Forecast tab is open. A fit still running for a previous selection is cancelled first. Nothing is fitted for sessions that stay on the other tabs, and a fit the pool has already started finishes into the forecast cache, so returning to the tab is fast."""
 
-        daily_dataframe = pd.DataFrame(data = daily_data)
-        daily_dataframe['date'] = daily_dataframe['date'].dt.date
+        fitForecast.cancel()
+        if input.navbar_id() != "Forecast":
+            return
 
-        prophet_df = daily_dataframe.rename(columns={'date': 'ds', 'temperature_2m_min': 'y'})
-        model = Prophet(growth='linear' if input.getForecastPlot() == 'linear' else 'flat')
-        model.fit(prophet_df)
-        forecast_model = model.make_future_dataframe(periods=365*int(input.yearsForecast()))
-        forecast = model.predict(forecast_model).tail(365*int(input.yearsForecast()))
-        p = model.plot(forecast, xlabel='', ylabel='Daily Minimum Temperature °'+input.units())
-        plt.axhline(y=input.plotTemperature(), color='#A9A9A9')
+        lat, lng = getCityCoordinates()
+        history = getDailyData()
+        fitForecast(history, lat, lng, input.dateRange()[0], input.dateRange()[1], input.getForecastPlot(), getYearsForecast(), input.units(), input.forecastEngine())
 
-        return p
+    @reactive.Calc()
+    @traced
+    def getForecastYears():
+        """A function to select the forecasted years from the fitted forecast, shared by the forecast plot and table."""
 
-    @render.data_frame()
-    def getForecastTable():
-        """A function to retrieve the forecasted weather tabular data for the selected city and temperature range."""
+        return fitForecast.result().tail(365*getYearsForecast())
 
-        startTemp = input.tableTemperature()[0]
-        endTemp = input.tableTemperature()[1]
+    @reactive.Calc()
+    @traced
+    def getForecastFingerprint():
+        """A function to fingerprint the fitted forecast, so sessions looking at the same forecast share the cached forecast plots."""
 
-        table = []
+        forecast = fitForecast.result()
+        return fingerprint(forecast['ds'].values, forecast['y'].values, forecast[FORECAST_COLUMNS].values)
 
-        df = pd.read_csv("data/cities.csv")
-        city_data = df[df['city_state'] == str(input.city())]
-        lat = city_data['lat'].values[0]
-        lng = city_data['lng'].values[0]
-    
-        params = {
-	    "latitude": lat,
-        "longitude": lng,
-        "start_date": input.dateRange()[0],
-        "end_date": input.dateRange()[1],
-        "daily": "temperature_2m_min",
-        "temperature_unit": "fahrenheit" if input.units() == "F" else "celsius",
-        }
-
-        responses = openmeteo.weather_api(url, params=params)
-        response = responses[0]
-        daily = response.Daily()
-        daily_temperature_2m_min = daily.Variables(0).ValuesAsNumpy()
-
-        daily_data = {"date": pd.date_range(
-            start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-            end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-            freq = pd.Timedelta(seconds=daily.Interval()),
-            inclusive = "left"
-        )}
-        
-        daily_data["temperature_2m_min"] = daily_temperature_2m_min
+    @render.image(delete_file=True)
+    @traced
+    def getForecastPlot():
+        """A function to retrieve the forecasted weather plot for the selected city for a specific date range and threshold temperature. Renderings are looked up in the shared plot cache first."""
 
-        daily_dataframe = pd.DataFrame(data = daily_data)
-        daily_dataframe['date'] = daily_dataframe['date'].dt.date
+        width, height, pixelratio = plotSize("getForecastPlot")
+        threshold = plotThreshold()
+        key = ("forecast", getForecastFingerprint(), getYearsForecast(), input.units(), threshold, width, height, pixelratio)
 
-        prophet_df = daily_dataframe.rename(columns={'date': 'ds', 'temperature_2m_min': 'y'})
-        model = Prophet(growth='linear' if input.getForecastPlot() == 'linear' else 'flat',interval_width=0.95)
-        model.fit(prophet_df)
-        forecast_model = model.make_future_dataframe(periods=365*int(input.yearsForecast()))
-        forecast = model.predict(forecast_model).tail(365*int(input.yearsForecast()))
-        
-        for t in range(endTemp, startTemp-1, -1):
-            days_below = forecast[forecast['yhat_lower'] < t].shape[0]
-            total_days = forecast.shape[0]
-            proportion_below = days_below / total_days            
-            table.append({"Temp": t, "Days Below": days_below, "Proportion Below": round(proportion_below,3)})
+        path = plot_cache.get(key)
+        if path is None:
+            p = plot_forecast(fitForecast.result(), getYearsForecast(), 'Daily Minimum Temperature °'+input.units(), threshold)
+            path = plot_cache.put(key, render_png(p, width, height, pixelratio))
 
-        table_df = pd.DataFrame(table)
+        return {"src": path, "width": "100%", "height": "100%", "alt": "Forecast daily minimum temperatures"}
+
+    @reactive.Calc()
+    @traced
+    def getSortedForecast():
+        """A function to sort the lower bound of the forecast's 95% interval once for the forecast table."""
+
+        return sort_temperatures(getForecastYears()['yhat_lower_95'])
+
+    @render.data_frame()
+    @traced
+    def getForecastTable():
+        """A function to retrieve the forecasted weather tabular data for the selected city and temperature range."""
+
+        table_df = exceedance_table(getSortedForecast(), tableRange()[0], tableRange()[1])
 
         return render.DataGrid(table_df,width="100%",height='fit-content')
 
     
     @render.text()
+    @traced
     def loc_coords():
         '''A function to display the latitude and longitude coordinates of the selected city.'''
 
         return getCoords()
     
     @render_widget()
+    @traced
     def map():
         '''A function to display the map with the marker at the selected city's location. This function uses the ipyleaflet library and is based of the documentation provided at: https://shiny.posit.co/py/components/outputs/map-ipyleaflet/'''
 
-        ans = getCoords()
-        l1,l2 = ans.split(", ")
-        lat = l1[:-2]
-        lng = l2[:-2]
+        from ipyleaflet import Map, Marker
+
+        lat, lng = getCityCoordinates()
         map = Map(center=(lat, lng), zoom=12, layout={'height': '200px'}) 
         point = Marker(location=(lat, lng), draggable=True)  
         map.add_layer(point)
         return map
 
-app = App(app_ui, server)
\ No newline at end of file
+    @reactive.Effect()
+    def markerMoved():
+        '''A function to select the city nearest to the map marker after it has been dragged.'''
+
+        point = map.widget.layers[-1]
+        lat, lng = reactive_read(point, "location")
+        nearest = city_catalog.nearest(lat, lng)
+        with reactive.isolate():
+            if nearest != input.city():
+                ui.update_selectize("city", selected=nearest)
+
+# The Shiny app is mounted under a Starlette app that also serves the Prometheus metrics (see metrics.py).
+app = Starlette(routes=[
+    Route("/metrics", metrics_endpoint),
+    Route("/metrics/sessions", sessions_endpoint),
+    Mount("/", app=App(app_ui, server)),
+])
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+A local, per-location archive of daily or hourly weather values stored as NumPy arrays. Each location keeps one
+contiguous series (one row of `per_day` values per day) together with a mask of the days that have been downloaded, so
+a new date range only fetches the spans that are missing and overlapping ranges are never stored twice. Reads are served
+as slices of memory-mapped files.
+
+Every write of a location publishes a new version directory holding the values, the mask and their start date, and
+then atomically replaces a small pointer file naming the current version, so a reader never pairs files from different
+writes. Reads and writes of a location are serialized with a per-location lock, held by one thread of a process at a
+time and, where `fcntl` is available, by one process at a time through an exclusive `flock` on a lock file. Worker
+threads, uvicorn workers and the prefetch and precompute jobs therefore never download the same days twice or lose
+each other's writes.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, so there writes are only serialized between threads of one process.
+    fcntl = None
+
+
+ONE_DAY = datetime.timedelta(days=1)
+# Attempts of `_load` to read a location whose current version is replaced while it is reading.
+LOAD_ATTEMPTS = 3
+
+
+def _spans(mask, first_day):
+    """A function to turn a boolean mask over consecutive days into a list of (start_date, end_date) spans where the mask is set."""
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return [(first_day + int(a) * ONE_DAY, first_day + int(b - 1) * ONE_DAY) for a, b in zip(edges[::2], edges[1::2])]
+
+
+class _LocationLock:
+    """The lock of one location: a re-entrant thread lock and, for the outermost holder, an exclusive `flock` on `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._rlock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            # Closing the file releases the flock.
+            self._file.close()
+            self._file = None
+        self._rlock.release()
+
+
+class WeatherArchive:
+    """Values of one weather variable, stored under `root` with one directory per location. `fetch` is called as `fetch(lat, lng, start_date, end_date)` for every missing span and must return `(grid_latitude, grid_longitude, values)` with `per_day` float32 values per day: 1 for daily variables and 24 for hourly ones. Hourly series are stored as (days, 24) arrays."""
+
+    def __init__(self, root, variable, fetch, per_day=1):
+        self.root = root
+        self.variable = variable
+        self.fetch = fetch
+        self.per_day = per_day
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, lat, lng):
+        """A function to return the lock of a location, creating it on first use."""
+
+        with self._locks_lock:
+            lock = self._locks.get((lat, lng))
+            if lock is None:
+                lock = self._locks[(lat, lng)] = _LocationLock(os.path.join(self._location_dir(lat, lng), self.variable + ".lock"))
+            return lock
+
+    def _location_dir(self, lat, lng):
+        return os.path.join(self.root, "{:.4f}_{:.4f}".format(lat, lng))
+
+    def _shape(self, days):
+        return (days,) if self.per_day == 1 else (days, self.per_day)
+
+    def _current_version(self, location_dir):
+        """A function to read the name of a location's current version directory, or None if it has none."""
+
+        try:
+            with open(os.path.join(location_dir, self.variable + ".current")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _load(self, lat, lng):
+        """A function to open the stored series for a location. Returns (meta, values, fetched) with memory-mapped arrays, or None if nothing is stored yet. Archives written before versioning, with the files directly in the location directory, are still read."""
+
+        location_dir = self._location_dir(lat, lng)
+        for _ in range(LOAD_ATTEMPTS):
+            version = self._current_version(location_dir)
+            if version is None:
+                paths = ["meta.json", self.variable + ".npy", self.variable + ".fetched.npy"]
+            else:
+                paths = [os.path.join(version, name) for name in ("meta.json", "values.npy", "fetched.npy")]
+            meta_path, values_path, fetched_path = [os.path.join(location_dir, path) for path in paths]
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                values = np.load(values_path, mmap_mode="r")
+                fetched = np.load(fetched_path, mmap_mode="r")
+            except FileNotFoundError:
+                # A writer may have published a new version and removed this one in the meantime.
+                if self._current_version(location_dir) == version:
+                    return None
+                continue
+            meta["start"] = datetime.date.fromisoformat(meta["start"])
+            return meta, values, fetched
+        return None
+
+    def _save(self, lat, lng, meta, values, fetched):
+        """A function to write a location's series as a new version directory and publish it by atomically replacing the pointer file. Older versions are removed afterwards: readers holding their memory maps are unaffected, and readers that lose the race retry with the new version. Must be called with the location's lock held."""
+
+        location_dir = self._location_dir(lat, lng)
+        token = "{}-{}-{}".format(time.time_ns(), os.getpid(), threading.get_ident())
+        version = "{}.{}".format(self.variable, token)
+        version_dir = os.path.join(location_dir, version)
+        os.makedirs(version_dir)
+        np.save(os.path.join(version_dir, "values.npy"), values)
+        np.save(os.path.join(version_dir, "fetched.npy"), fetched)
+        with open(os.path.join(version_dir, "meta.json"), "w") as f:
+            json.dump({**meta, "start": meta["start"].isoformat()}, f)
+
+        tmp = os.path.join(location_dir, "{}.current.{}.tmp".format(self.variable, token))
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(location_dir, self.variable + ".current"))
+
+        for name in os.listdir(location_dir):
+            path = os.path.join(location_dir, name)
+            if name.startswith(self.variable + ".") and name != version and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        for name in ("meta.json", self.variable + ".npy", self.variable + ".fetched.npy"):
+            if os.path.exists(os.path.join(location_dir, name)):
+                os.remove(os.path.join(location_dir, name))
+
+    def missing_spans(self, lat, lng, start_date, end_date):
+        """A function to list the (start_date, end_date) spans of the requested range that have not been downloaded yet."""
+
+        stored = self._load(lat, lng)
+        days = (end_date - start_date).days + 1
+        if stored is None:
+            return [(start_date, end_date)]
+        meta, _, fetched = stored
+        offset = (start_date - meta["start"]).days
+        missing = np.ones(days, dtype=bool)
+        lo, hi = max(offset, 0), min(offset + days, len(fetched))
+        if lo < hi:
+            missing[lo - offset:hi - offset] = ~fetched[lo:hi]
+        return _spans(missing, start_date)
+
+    def store(self, lat, lng, start_date, latitude, longitude, new_values):
+        """A function to merge newly downloaded values starting at `start_date` into a location's series, growing it as needed."""
+
+        new_values = np.asarray(new_values, dtype=np.float32).reshape(self._shape(-1))
+        with self._lock(lat, lng):
+            stored = self._load(lat, lng)
+            end_date = start_date + (len(new_values) - 1) * ONE_DAY
+            if stored is None:
+                meta = {"start": start_date, "latitude": latitude, "longitude": longitude}
+                values = np.full(self._shape(len(new_values)), np.nan, dtype=np.float32)
+                fetched = np.zeros(len(new_values), dtype=bool)
+            else:
+                meta, old_values, old_fetched = stored
+                first = min(meta["start"], start_date)
+                last = max(meta["start"] + (len(old_values) - 1) * ONE_DAY, end_date)
+                values = np.full(self._shape((last - first).days + 1), np.nan, dtype=np.float32)
+                fetched = np.zeros(len(values), dtype=bool)
+                shift = (meta["start"] - first).days
+                values[shift:shift + len(old_values)] = old_values
+                fetched[shift:shift + len(old_fetched)] = old_fetched
+                meta = {**meta, "start": first}
+
+            offset = (start_date - meta["start"]).days
+            values[offset:offset + len(new_values)] = new_values
+            fetched[offset:offset + len(new_values)] = True
+            self._save(lat, lng, meta, values, fetched)
+
+    def read(self, lat, lng, start_date, end_date):
+        """A function to return (grid_latitude, grid_longitude, values) for a date range, downloading only the spans that are missing from the archive. `values` is a read-only view into the memory-mapped series, with one row per day for hourly variables."""
+
+        with self._lock(lat, lng):
+            for span_start, span_end in self.missing_spans(lat, lng, start_date, end_date):
+                latitude, longitude, new_values = self.fetch(lat, lng, span_start, span_end)
+                self.store(lat, lng, span_start, latitude, longitude, new_values)
+            meta, values, _ = self._load(lat, lng)
+
+        offset = (start_date - meta["start"]).days
+        return meta["latitude"], meta["longitude"], values[offset:offset + (end_date - start_date).days + 1]
@@ -0,0 +1,136 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Benchmarks the dashboard's outputs against recorded OpenMeteo responses. Every repeat starts the app cold in a fresh
+working directory, opens one session and walks it through a fixed sequence of input changes (city, units, sliders, date
+range, rolling averages, hourly resolution, tab switch and the forecast options). For every change it reports how long each output took to
+show its new value, as p50, p95 and maximum over the repeats, with the archive API calls the change caused and the peak
+memory of the server.
+
+The API is served by replay_server.py from a fixtures directory, so the results do not depend on the network. Record the
+fixtures once with --record, or use --synthetic on machines without network access. Use --json to keep a history of
+results and compare releases.
+
+Usage:
+    python benchmark-outputs.py --record https://archive-api.open-meteo.com/v1/archive
+    python benchmark-outputs.py --repeat 5 --json benchmarks.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from replay_server import start_server
+from shiny_client import AppServer, ShinySession, initial_inputs, tab_inputs
+
+
+# Outputs that are timed, as named in the dashboard's server function.
+BENCHMARK_OUTPUTS = ["getHistTable", "getHistPlot", "getForecastPlot", "getForecastTable", "loc_coords", "map"]
+# (label, inputs) of every input change after the session's init, in order.
+STEPS = [
+    ("city", {"city": "Chicago, Illinois"}),
+    ("units", {"units": "C", "plotTemperature": -15, "tableTemperature": [-20, -10]}),
+    ("plot slider", {"plotTemperature": -10}),
+    ("table slider", {"tableTemperature": [-15, -5]}),
+    ("date range", {"dateRange:shiny.date": ["2020-01-01", "2024-01-01"]}),
+    ("rolling averages", {"weeklyAvg": True, "monthlyAvg": True}),
+    ("hourly", {"resolution": "hourly"}),
+    ("hourly table", {"tableTemperature": [-10, 0]}),
+    ("daily", {"resolution": "daily"}),
+    ("forecast tab", tab_inputs("Forecast")),
+    ("forecast model", {"forecastEngine": "harmonic"}),
+    ("forecast trend", {"getForecastPlot": "linear"}),
+    ("forecast years", {"yearsForecast": 3}),
+    ("city, cached", {"city": "Urbana, Illinois"}),
+    ("historical tab", tab_inputs("Historical")),
+]
+
+
+async def run_scenario(app, replay, timeout):
+    """A function to walk one session through the init and every step. Returns a list of (label, renders, errors, API requests, API bytes, peak memory in MB) per step."""
+
+    results = []
+    async with ShinySession(app.websocket_url, timeout) as session:
+        for label, method, inputs in [("init", "init", initial_inputs())] + [(label, "update", inputs) for label, inputs in STEPS]:
+            requests, sent = replay.requests, replay.bytes_sent
+            renders, errors = await (session.init(inputs) if method == "init" else session.update(inputs))
+            results.append((label, renders, errors, replay.requests - requests, replay.bytes_sent - sent, app.memory()[1]))
+    return results
+
+
+def percentiles(values):
+    """A function to summarise latencies in seconds as (p50, p95, max) in milliseconds."""
+
+    values = np.asarray(values) * 1000
+    return np.percentile(values, 50), np.percentile(values, 95), values.max()
+
+
+def benchmark(fixtures, record=None, synthetic=False, repeat=3, timeout=180):
+    """A function to run the scenario on `repeat` cold starts of the app, with the API replayed from `fixtures`. Returns one summary dict per step."""
+
+    replay = start_server(fixtures, record, synthetic=synthetic)
+    runs = []
+    try:
+        for _ in range(repeat):
+            with AppServer(replay.url, cold=True) as app:
+                runs.append(asyncio.run(run_scenario(app, replay, timeout)))
+    finally:
+        replay.shutdown()
+
+    summary = []
+    for i, (label, *_) in enumerate(runs[0]):
+        steps = [run[i] for run in runs]
+        outputs = {}
+        for name in BENCHMARK_OUTPUTS:
+            times = [renders[name] for _, renders, _, _, _, _ in steps if name in renders]
+            if times:
+                outputs[name] = dict(zip(("p50_ms", "p95_ms", "max_ms"), percentiles(times)), renders=len(times))
+        errors = sorted({name for _, _, step_errors, _, _, _ in steps for name in step_errors})
+        summary.append({
+            "step": label,
+            "outputs": outputs,
+            "errors": errors,
+            "api_requests": float(np.mean([step[3] for step in steps])),
+            "api_bytes": float(np.mean([step[4] for step in steps])),
+            "peak_memory_mb": max((step[5] for step in steps if step[5] is not None), default=None),
+        })
+    return summary
+
+
+def print_summary(summary):
+    """A function to print the benchmark summary as a table."""
+
+    print("{:18s} {:18s} {:>9s} {:>9s} {:>9s} {:>9s} {:>10s} {:>9s}".format("step", "output", "p50 ms", "p95 ms", "max ms", "API calls", "API KB", "peak MB"))
+    for step in summary:
+        first = True
+        for name, timing in step["outputs"].items():
+            print("{:18s} {:18s} {:9.0f} {:9.0f} {:9.0f}".format(step["step"] if first else "", name, timing["p50_ms"], timing["p95_ms"], timing["max_ms"]), end="")
+            if first:
+                print(" {:9.1f} {:10.1f} {:9.0f}".format(step["api_requests"], step["api_bytes"] / 1024, step["peak_memory_mb"] or 0), end="")
+            print()
+            first = False
+        if first:
+            print("{:18s} {:18s} {:>29s} {:9.1f} {:10.1f} {:9.0f}".format(step["step"], "(no output changed)", "", step["api_requests"], step["api_bytes"] / 1024, step["peak_memory_mb"] or 0))
+        for name in step["errors"]:
+            print("{:18s} {:18s} error".format("", name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's outputs against replayed OpenMeteo responses.")
+    parser.add_argument("--fixtures", default="fixtures/openmeteo", help="directory of recorded API responses")
+    parser.add_argument("--record", metavar="UPSTREAM_URL", help="record missing responses from this URL")
+    parser.add_argument("--synthetic", action="store_true", help="generate missing responses instead of recording them")
+    parser.add_argument("--repeat", type=int, default=3, help="number of cold starts to run the scenario on")
+    parser.add_argument("--timeout", type=float, default=180, help="seconds to wait for the outputs of one step")
+    parser.add_argument("--json", metavar="PATH", help="also append the results as one JSON line to this file")
+    args = parser.parse_args()
+
+    summary = benchmark(args.fixtures, args.record, args.synthetic, args.repeat, args.timeout)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps({"time": time.time(), "repeat": args.repeat, "steps": summary}) + "\n")
@@ -0,0 +1,284 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+A bounded cache of raw OpenMeteo API responses, shared by every worker process. It replaces the requests_cache SQLite
+file, which never expired or evicted anything. Two backends implement the same `get`/`put`/`stats` interface:
+
+- `SQLiteCache`, the default, stores zlib-compressed FlatBuffer payloads in a WAL-mode SQLite database, so several
+  uvicorn workers can read concurrently while one writes.
+- `MemoryCache` keeps the payloads in the process, for a single worker or for scripts.
+
+Both keep the payloads under a byte budget, evicting expired entries first and then the least recently used ones.
+Archive data for past dates never changes, so those responses are pinned (they never expire), while responses that
+include recent days expire after a TTL and are fetched again.
+
+Usage:
+    python cache.py
+"""
+
+import argparse
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from metrics import increment
+
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.environ.get("CACHE_PATH", "data/response-cache.sqlite")
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Seconds before a response that includes recent days is fetched again.
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 24 * 60 * 60))
+# The archive API keeps revising its most recent days, so only ranges ending before this many days ago are pinned.
+PIN_AFTER_DAYS = 7
+
+
+def request_key(url):
+    """A function to derive the cache key of a request URL. Query parameters are sorted, so the order in which a client sends them does not matter."""
+
+    parts = urllib.parse.urlsplit(url)
+    params = sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    return hashlib.sha1("{}://{}{}?{}".format(parts.scheme, parts.netloc, parts.path, urllib.parse.urlencode(params)).encode()).hexdigest()
+
+
+def is_pinned(url, today=None):
+    """A function to decide whether a request only covers past dates that the archive will not revise, so its response can be kept without expiry."""
+
+    params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+    try:
+        end_date = datetime.date.fromisoformat(params["end_date"])
+    except (KeyError, ValueError):
+        return False
+    today = today or datetime.date.today()
+    return end_date < today - datetime.timedelta(days=PIN_AFTER_DAYS)
+
+
+class ResponseCache:
+    """The interface of the response cache backends. `get` returns the payload bytes or None; `put` stores a payload that expires after `ttl` seconds, or never if `pinned`."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, payload, pinned=False):
+        raise NotImplementedError
+
+    def size(self):
+        """A function to return the number of entries and the stored (compressed) bytes."""
+
+        raise NotImplementedError
+
+    def stats(self):
+        """A function to report the hit, miss, eviction and expiration counts of this process with the current size of the cache."""
+
+        entries, size = self.size()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations, "entries": entries, "bytes": size}
+
+
+class MemoryCache(ResponseCache):
+    """Compressed payloads in an in-process LRU OrderedDict."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        super().__init__(max_bytes, ttl)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.time():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return zlib.decompress(entry[0])
+
+    def put(self, key, payload, pinned=False):
+        data = zlib.compress(payload)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (data, None if pinned else time.time() + self.ttl)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries), self._bytes
+
+
+class SQLiteCache(ResponseCache):
+    """Compressed payloads in a WAL-mode SQLite database that any number of threads and processes can share. Every thread opens its own connection."""
+
+    # Access times are only rewritten when they are older than this, so cache hits rarely need a write lock.
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        super().__init__(max_bytes, ttl)
+        self.path = path
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+
+    def _connection(self):
+        """A function to return this thread's connection, creating the database on first use."""
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL,
+                accessed REAL NOT NULL, expires REAL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, counter, n=1):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT payload, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is not None and row[1] is not None and row[1] < now:
+            connection.execute("DELETE FROM responses WHERE key = ? AND expires < ?", (key, now))
+            self._count("expirations")
+            row = None
+        if row is None:
+            self._count("misses")
+            return None
+        connection.execute("UPDATE responses SET accessed = ? WHERE key = ? AND accessed < ?", (now, key, now - self.TOUCH_INTERVAL))
+        self._count("hits")
+        return zlib.decompress(row[0])
+
+    def put(self, key, payload, pinned=False):
+        data = zlib.compress(payload)
+        now = time.time()
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so the size check and eviction see a consistent database.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("INSERT OR REPLACE INTO responses (key, payload, size, accessed, expires) VALUES (?, ?, ?, ?, ?)",
+                               (key, data, len(data), now, None if pinned else now + self.ttl))
+            self._evict(connection, key, now)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _evict(self, connection, keep, now):
+        """A function to delete expired entries, then the least recently used entries, until the payloads fit in the byte budget. The entry `keep`, just stored, is never evicted."""
+
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = connection.execute("DELETE FROM responses WHERE expires < ?", (now,)).rowcount
+        self._count("expirations", expired)
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        victims = []
+        for key, size in connection.execute("SELECT key, size FROM responses WHERE key != ? ORDER BY accessed", (keep,)):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._count("evictions", len(victims))
+
+    def size(self):
+        return tuple(self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone())
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """A requests transport adapter that gives every request `timeout`, a (connect, read) pair in seconds, unless the caller set one. requests itself waits forever by default."""
+
+    def __init__(self, timeout, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def send(self, request, **kwargs):
+        kwargs["timeout"] = kwargs.get("timeout") or self.timeout
+        return super().send(request, **kwargs)
+
+
+class CachingAdapter(TimeoutAdapter):
+    """A `TimeoutAdapter` that answers GET requests from a `ResponseCache` and stores successful responses in it."""
+
+    def __init__(self, cache, timeout, **kwargs):
+        super().__init__(timeout, **kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        key = request_key(request.url) if request.method == "GET" else None
+        if key is not None:
+            payload = self.cache.get(key)
+            if payload is not None:
+                return self._cached_response(request, payload)
+
+        response = super().send(request, **kwargs)
+        increment("upstream_requests_total", status=response.status_code)
+        increment("upstream_bytes_total", len(response.content))
+        if key is not None and response.status_code == 200:
+            self.cache.put(key, response.content, pinned=is_pinned(request.url))
+        return response
+
+    def _cached_response(self, request, payload):
+        """A function to wrap a cached payload in a `requests.Response`."""
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/octet-stream", "Content-Length": str(len(payload))})
+        response._content = payload
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+def open_cache(backend=CACHE_BACKEND):
+    """A function to create the response cache selected by CACHE_BACKEND."""
+
+    if backend == "memory":
+        return MemoryCache()
+    return SQLiteCache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the size of the OpenMeteo response cache.")
+    parser.add_argument("--path", default=CACHE_PATH)
+    args = parser.parse_args()
+
+    connection = SQLiteCache(args.path)._connection()
+    entries, size, pinned = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COUNT(*) - COUNT(expires) FROM responses").fetchone()
+    print("{} entries ({} pinned), {:.1f} MB compressed, budget {:.1f} MB".format(entries, pinned, size / 1e6, CACHE_MAX_BYTES / 1e6))
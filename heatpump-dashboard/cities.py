@@ -0,0 +1,92 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+An in-memory catalog of the cities built by process-data.py. It is built once at startup with a hash index from city name
+to coordinates and a KD-tree over the city locations, so both name lookups and nearest-city lookups from the map are
+fast. The columnar data/cities directory is memory-mapped when it exists; otherwise the catalog is parsed from
+data/cities.csv, which has no populations, states or counties.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from metrics import span
+
+
+CITY_DATA = "data/cities"
+CITY_CSV = "data/cities.csv"
+
+
+def _unit_vectors(lat, lng):
+    """A function to project latitudes and longitudes (in degrees) onto the unit sphere, so that Euclidean nearest neighbours in the KD-tree are also the nearest cities along the Earth's surface."""
+
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+
+class CityCatalog:
+    """The list of selectable cities with their coordinates stored as a compact float32 (lat, lng) array. `population`, `state` and `county` are per-city arrays (the last two categorical) when the data has them, and None otherwise."""
+
+    def __init__(self, names, lat, lng, population=None, state=None, county=None):
+        self.names = list(names)
+        self.coords = np.column_stack((lat, lng)).astype(np.float32)
+        self.population = population
+        self.state = state
+        self.county = county
+        self._index = {}
+        for i, name in enumerate(self.names):
+            self._index.setdefault(name, i)
+        self._tree = cKDTree(_unit_vectors(self.coords[:, 0], self.coords[:, 1]))
+
+    @classmethod
+    def from_csv(cls, path):
+        """A function to build the catalog from a CSV file with `city_state`, `lat` and `lng` columns."""
+
+        df = pd.read_csv(path)
+        return cls(df['city_state'], df['lat'].values, df['lng'].values)
+
+    @classmethod
+    def from_npy(cls, path):
+        """A function to build the catalog from the columnar directory written by process-data.py. Every column is memory-mapped rather than parsed."""
+
+        def column(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+        return cls(
+            column("names").tolist(), column("lat"), column("lng"),
+            population=column("population"),
+            state=pd.Categorical.from_codes(column("state"), categories=column("states")),
+            county=pd.Categorical.from_codes(column("county"), categories=column("counties")),
+        )
+
+    @classmethod
+    def load(cls, path=CITY_DATA, csv_path=CITY_CSV):
+        """A function to load the catalog from the columnar directory if process-data.py has built it, falling back to the CSV."""
+
+        if os.path.exists(os.path.join(path, "meta.json")):
+            with span("cities_load", source="npy"):
+                return cls.from_npy(path)
+        with span("cities_load", source="csv"):
+            return cls.from_csv(csv_path)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self.names)
+
+    def coordinates(self, name):
+        """A function to return the (lat, lng) of a city. Raises KeyError for unknown cities. Coordinates are rounded back to the 4 decimals of the source data, so float32 storage does not leak into API requests."""
+
+        lat, lng = self.coords[self._index[name]]
+        return round(float(lat), 4), round(float(lng), 4)
+
+    def nearest(self, lat, lng):
+        """A function to return the name of the city closest to a location."""
+
+        _, i = self._tree.query(_unit_vectors([lat], [lng])[0])
+        return self.names[i]
@@ -0,0 +1,94 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Compares the accuracy and latency of the forecast engines in engines.py on archived data. Each engine is trained on
+the days before `--split` and scored on the held-out days up to `--end`: mean absolute error and RMSE of `yhat`, and
+the share of held-out days inside the 80% and 95% intervals. The harmonic engine is also timed fitting every city at
+once with its batched solve. Run prefetch-data.py first so the data comes from the local archive.
+
+Usage:
+    python compare-engines.py --cities 50 --start 2020-01-01 --split 2023-01-01 --end 2024-01-01
+"""
+
+import argparse
+import datetime
+import logging
+import time
+import numpy as np
+import pandas as pd
+from cities import CityCatalog
+from engines import ENGINES
+from weather import fetch_daily
+
+
+def score(forecast, actual):
+    """A function to score the future part of a forecast frame against the held-out temperatures."""
+
+    future = forecast.tail(len(actual))
+    error = future['yhat'].values - actual
+    valid = np.isfinite(actual)
+    inside_80 = (actual >= future['yhat_lower'].values) & (actual <= future['yhat_upper'].values)
+    inside_95 = (actual >= future['yhat_lower_95'].values) & (actual <= future['yhat_upper_95'].values)
+    return {
+        "mae": np.abs(error[valid]).mean(),
+        "rmse": np.sqrt((error[valid] ** 2).mean()),
+        "coverage_80": inside_80[valid].mean(),
+        "coverage_95": inside_95[valid].mean(),
+    }
+
+
+def compare(catalog, count, start_date, split_date, end_date, growth):
+    """A function to evaluate every engine on the first `count` cities of the catalog and print a summary table."""
+
+    logging.getLogger("cmdstanpy").disabled = True
+    names = catalog.names[:count]
+    train_days = (split_date - start_date).days
+    years = ((end_date - split_date).days + 364) // 365
+
+    histories = {}
+    for name in names:
+        daily = fetch_daily(*catalog.coordinates(name), start_date, end_date).daily
+        histories[name] = (daily.iloc[:train_days], daily['temperature_2m_min'].values[train_days:].astype(np.float64))
+
+    rows = []
+    for engine in ENGINES.values():
+        for name, (train, actual) in histories.items():
+            started = time.perf_counter()
+            forecast = engine.forecast(train, growth, years)
+            elapsed = time.perf_counter() - started
+            # Engines forecast whole years; only the held-out days are scored.
+            forecast = forecast.iloc[:train_days + len(actual)]
+            rows.append({"engine": engine.name, "city": name, "fit_ms": elapsed * 1000, **score(forecast, actual)})
+
+    results = pd.DataFrame(rows)
+    summary = results.groupby("engine").agg(
+        cities=("city", "count"),
+        fit_ms_p50=("fit_ms", "median"),
+        fit_ms_p95=("fit_ms", lambda s: s.quantile(0.95)),
+        mae=("mae", "mean"),
+        rmse=("rmse", "mean"),
+        coverage_80=("coverage_80", "mean"),
+        coverage_95=("coverage_95", "mean"),
+    )
+    print(summary.round(3).to_string())
+
+    values = np.column_stack([train['temperature_2m_min'].values for train, _ in histories.values()])
+    started = time.perf_counter()
+    ENGINES["harmonic"].fit_many(values, growth, years)
+    elapsed = time.perf_counter() - started
+    print("\nharmonic batched fit of {} cities: {:.1f} ms ({:.3f} ms per city)".format(len(names), elapsed * 1000, elapsed * 1000 / len(names)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare forecast engines on archived data.")
+    parser.add_argument("--cities", type=int, default=20, help="number of cities to evaluate, from the top of the catalog")
+    parser.add_argument("--catalog", default="data/cities.csv")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date(2020, 1, 1))
+    parser.add_argument("--split", type=datetime.date.fromisoformat, default=datetime.date(2023, 1, 1))
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date(2024, 1, 1))
+    parser.add_argument("--growth", choices=["flat", "linear"], default="flat")
+    args = parser.parse_args()
+
+    compare(CityCatalog.from_csv(args.catalog), args.cities, args.start, args.split, args.end, args.growth)
@@ -0,0 +1,132 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Forecast engines for the Forecast tab. Every engine takes the daily history and returns a forecast frame with the same
+columns: `ds`, the observed temperatures in `y`, the prediction in `yhat`, the 80% interval in `yhat_lower`/`yhat_upper`
+and the 95% interval in `yhat_lower_95`/`yhat_upper_95`.
+
+- `ProphetEngine` fits the Prophet model the dashboard has always used. It takes seconds per fit, so it runs in the
+  forecast process pool.
+- `HarmonicEngine` fits annual seasonality (a few Fourier terms) plus an optional linear trend by least squares. It
+  fits in milliseconds, can fit many cities at once as a single matrix solve, and is cheap enough to run in-process.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+
+INTERVAL_WIDTHS = {"": 0.8, "_95": 0.95}
+
+
+def _observed(history):
+    """A function to rename a daily history frame to the `ds`/`y` columns used by the engines."""
+
+    observed = history.rename(columns={'date': 'ds', 'temperature_2m_min': 'y'})
+    observed['ds'] = pd.to_datetime(observed['ds'])
+    return observed
+
+
+class ForecastEngine:
+    """The interface every forecast engine implements."""
+
+    name = ""
+    # Engines that take seconds to fit are run in the process pool so they do not block the server.
+    use_process_pool = False
+
+    def forecast(self, history, growth, years):
+        """A function to fit the engine on a daily history and predict `years` years ahead. `growth` is either 'flat' or 'linear'."""
+
+        raise NotImplementedError
+
+
+class ProphetEngine(ForecastEngine):
+    name = "prophet"
+    use_process_pool = True
+
+    def forecast(self, history, growth, years):
+        # Prophet and its Stan backend take seconds to import, so they are only loaded by the processes that fit.
+        from prophet import Prophet
+
+        prophet_df = history.rename(columns={'date': 'ds', 'temperature_2m_min': 'y'})
+        model = Prophet(growth='linear' if growth == 'linear' else 'flat')
+        started = time.perf_counter()
+        model.fit(prophet_df)
+        fitted = time.perf_counter()
+        future = model.make_future_dataframe(periods=365*int(years))
+        forecast = model.predict(future)[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+        # The uncertainty interval is computed at predict time, so the 95% interval reuses the same fitted model.
+        model.interval_width = 0.95
+        forecast_95 = model.predict(future)
+        forecast['yhat_lower_95'] = forecast_95['yhat_lower'].values
+        forecast['yhat_upper_95'] = forecast_95['yhat_upper'].values
+        observed = _observed(history)
+        forecast['y'] = forecast['ds'].map(pd.Series(observed['y'].values, index=observed['ds']))
+
+        # The fit runs in a pool process, so its timings travel back with the frame for the server's metrics.
+        forecast.attrs["timings"] = {"prophet_fit": fitted - started, "prophet_predict": time.perf_counter() - fitted}
+        return forecast
+
+
+class HarmonicEngine(ForecastEngine):
+    """Least-squares harmonic regression: `harmonics` pairs of annual sine/cosine terms, an intercept and, for linear growth, a linear trend. Prediction intervals come from the residuals: their seasonal spread is modelled with the same Fourier terms and the interval bounds are empirical quantiles of the standardized residuals."""
+
+    name = "harmonic"
+
+    def __init__(self, harmonics=3):
+        self.harmonics = harmonics
+
+    def _design(self, t, growth):
+        """A function to build the regression matrix for days `t` (days since the first observation)."""
+
+        columns = [np.ones_like(t)]
+        if growth == 'linear':
+            columns.append(t / 365.25)
+        for k in range(1, self.harmonics + 1):
+            angle = 2 * np.pi * k * t / 365.25
+            columns += [np.sin(angle), np.cos(angle)]
+        return np.column_stack(columns)
+
+    def fit_many(self, values, growth, years):
+        """A function to fit one model per column of `values` (days x locations, all on the same dates) with a single least-squares solve. Days missing at any location are left out of every fit. Returns a dict of (days + future days) x locations arrays keyed by the forecast column names."""
+
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        days = values.shape[0]
+        t = np.arange(days + 365*int(years), dtype=np.float64)
+        X = self._design(t, growth)
+        observed = np.isfinite(values).all(axis=1)
+        X_fit = X[:days][observed]
+
+        coef, *_ = np.linalg.lstsq(X_fit, values[observed], rcond=None)
+        yhat = X @ coef
+        residuals = values[observed] - yhat[:days][observed]
+
+        # Winter minimums vary much more than summer ones, so the residual spread gets its own seasonal fit.
+        S = self._design(t, 'flat')
+        spread_coef, *_ = np.linalg.lstsq(S[:days][observed], residuals ** 2, rcond=None)
+        spread = np.sqrt(np.clip(S @ spread_coef, 1e-6, None))
+        standardized = residuals / spread[:days][observed]
+
+        result = {"yhat": yhat}
+        for suffix, width in INTERVAL_WIDTHS.items():
+            lower, upper = np.quantile(standardized, [(1 - width) / 2, (1 + width) / 2], axis=0)
+            result["yhat_lower" + suffix] = yhat + spread * lower
+            result["yhat_upper" + suffix] = yhat + spread * upper
+        return result
+
+    def forecast(self, history, growth, years):
+        observed = _observed(history)
+        result = self.fit_many(observed['y'].values, growth, years)
+        forecast = pd.DataFrame({"ds": pd.date_range(observed['ds'].iloc[0], periods=len(result['yhat']), freq="D")})
+        for column, values in result.items():
+            forecast[column] = values[:, 0]
+        forecast['y'] = forecast['ds'].map(pd.Series(observed['y'].values, index=observed['ds']))
+        return forecast
+
+
+ENGINES = {engine.name: engine for engine in (ProphetEngine(), HarmonicEngine())}
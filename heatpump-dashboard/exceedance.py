@@ -0,0 +1,92 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Threshold exceedance counts for the "Days Below" tables. A temperature series is sorted once, after which the number
+of days below any set of thresholds is answered with a single `searchsorted` call instead of one DataFrame filter per
+threshold. Works the same for observed temperatures and for any forecast column (`yhat_lower`, `yhat`, `yhat_upper`).
+
+Hourly series are summarised instead of sorted: one pass over fixed-size chunks counts the hours and sums the
+temperatures in every whole-degree bin, so memory stays constant however long the series is. The hours below any
+whole-degree threshold and the heating degree hours with that threshold as the balance point follow from cumulative
+sums of the bins.
+"""
+
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+
+# Hours processed per chunk by `hourly_histogram`, about a month.
+CHUNK_HOURS = 24 * 32
+# Whole-degree bins from FIRST_BIN up to FIRST_BIN + BINS - 1 cover any temperature in Celsius or Fahrenheit.
+FIRST_BIN = -100
+BINS = 250
+
+
+def sort_temperatures(values):
+    """A function to prepare a temperature series for exceedance queries. Missing values sort to the end, so they are never counted as below a threshold but are still part of the total number of days."""
+
+    return np.sort(np.asarray(values, dtype=np.float64))
+
+
+def days_below(sorted_values, thresholds):
+    """A function to count the days strictly below each threshold in a series prepared by `sort_temperatures`."""
+
+    return np.searchsorted(sorted_values, np.asarray(thresholds, dtype=np.float64), side='left')
+
+
+def exceedance_table(sorted_values, start_temp, end_temp):
+    """A function to build the "Days Below" table for every whole-degree threshold from `end_temp` down to `start_temp`."""
+
+    thresholds = np.arange(end_temp, start_temp-1, -1)
+    below = days_below(sorted_values, thresholds)
+    proportion_below = below / len(sorted_values) if len(sorted_values) else np.zeros(len(thresholds))
+
+    return pd.DataFrame({"Temp": thresholds, "Days Below": below, "Proportion Below": np.round(proportion_below, 3)})
+
+
+class TemperatureHistogram(NamedTuple):
+    """The hours in every whole-degree bin `[FIRST_BIN + i, FIRST_BIN + i + 1)` of an hourly series, the sum of their temperatures, and the total number of hours including missing ones."""
+
+    counts: np.ndarray
+    sums: np.ndarray
+    hours: int
+
+
+def hourly_histogram(values, units="C", chunk_hours=CHUNK_HOURS):
+    """A function to summarise an hourly Celsius series in the selected units with one pass over chunks of `chunk_hours` values, so only one chunk is ever converted to float64. Missing hours are left out of the bins."""
+
+    counts = np.zeros(BINS, dtype=np.int64)
+    sums = np.zeros(BINS, dtype=np.float64)
+    for start in range(0, len(values), chunk_hours):
+        chunk = np.asarray(values[start:start + chunk_hours], dtype=np.float64)
+        chunk = chunk[~np.isnan(chunk)]
+        if units == "F":
+            chunk = chunk * 9 / 5 + 32
+        bins = np.clip(np.floor(chunk).astype(np.int64) - FIRST_BIN, 0, BINS - 1)
+        counts += np.bincount(bins, minlength=BINS)
+        sums += np.bincount(bins, weights=chunk, minlength=BINS)
+    return TemperatureHistogram(counts, sums, len(values))
+
+
+def hours_below(histogram, thresholds):
+    """A function to count the hours strictly below each whole-degree threshold and their heating degree hours, the sum of `threshold - temperature` over those hours. Returns (hours, degree_hours)."""
+
+    thresholds = np.asarray(thresholds, dtype=np.int64)
+    edges = np.clip(thresholds - FIRST_BIN, 0, BINS)
+    below = np.concatenate(([0], np.cumsum(histogram.counts)))[edges]
+    below_sums = np.concatenate(([0.0], np.cumsum(histogram.sums)))[edges]
+    return below, thresholds * below - below_sums
+
+
+def hourly_exceedance_table(histogram, start_temp, end_temp):
+    """A function to build the "Hours Below" table for every whole-degree threshold from `end_temp` down to `start_temp`, with the heating degree hours of each threshold as the balance point."""
+
+    thresholds = np.arange(end_temp, start_temp-1, -1)
+    below, degree_hours = hours_below(histogram, thresholds)
+    proportion_below = below / histogram.hours if histogram.hours else np.zeros(len(thresholds))
+
+    return pd.DataFrame({"Temp": thresholds, "Hours Below": below, "Proportion Below": np.round(proportion_below, 3),
+                         "Heating Degree Hours": np.round(degree_hours).astype(np.int64)})
@@ -0,0 +1,218 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Forecasting for the dashboard. A forecast is fitted once per (city, date range, growth, years, units, engine). Prophet
+fits run in a separate worker process so that the Stan optimisation does not block the Shiny event loop, and every
+result is kept in a bounded LRU cache that is shared by the forecast plot, the forecast table and every session on the worker. Forecasts can
+also be precomputed offline with precompute-forecasts.py and served from disk.
+"""
+
+import asyncio
+import importlib
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from engines import ENGINES
+from metrics import observe, shared, span
+
+
+MAX_CACHED_FORECASTS = 32
+# Processes of the fitting pool. Every server worker has its own pool, so the default stays small; raise it on hosts
+# running a single server worker with cores to spare.
+POOL_WORKERS = int(os.environ.get("FORECAST_WORKERS", "2"))
+
+# "live" fits every forecast on demand; "precomputed" serves forecasts written by precompute-forecasts.py and only
+# falls back to live fitting for selections that were not precomputed.
+FORECAST_MODE = os.environ.get("FORECAST_MODE", "live")
+PRECOMPUTED_DIR = "data/forecasts"
+MAX_YEARS = 5
+FORECAST_COLUMNS = ['yhat', 'yhat_lower', 'yhat_upper', 'yhat_lower_95', 'yhat_upper_95']
+
+_forecasts = OrderedDict()
+_pending = {}
+_waiters = {}
+_executor = None
+_hits = 0
+_misses = 0
+
+
+def fit_forecast(history, growth, years, engine="prophet"):
+    """A function to fit a forecast engine (see engines.py) on the daily minimum temperatures and predict the given number of years. Returns the full prediction frame (history and future) with the observed temperatures in `y`, the default 80% interval in `yhat_lower`/`yhat_upper` and the 95% interval used by the forecast table in `yhat_lower_95`/`yhat_upper_95`."""
+
+    return ENGINES[engine].forecast(history, growth, years)
+
+
+def _get_executor():
+    """A function to lazily create the process pool used for fitting. Workers are spawned rather than forked so they do not inherit the server's event loop and threads."""
+
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _import_module(name):
+    """A function to import a module in a pool process. Returns the seconds the import took."""
+
+    started = time.perf_counter()
+    importlib.import_module(name)
+    return time.perf_counter() - started
+
+
+def warm_pool(name):
+    """A function to start every process of the fitting pool and import the module `name` in each, so the first fits pay for neither. Returns the futures of the imports."""
+
+    executor = _get_executor()
+    # The pool starts a new process for every task submitted while all of its processes are busy.
+    return [executor.submit(_import_module, name) for _ in range(POOL_WORKERS)]
+
+
+def _store_forecast(key, fit, submitted):
+    """A function to move a finished fit into the LRU cache and record its timings, measured in the pool process, and its time from submission. Fits that were still running when their callers went away are kept as well, so returning to a previous selection is instant."""
+
+    if _pending.get(key) is fit:
+        _pending.pop(key)
+        _waiters.pop(key, None)
+    if fit.cancelled() or fit.exception() is not None:
+        return
+    forecast = fit.result()
+    observe("forecast_fit", time.perf_counter() - submitted, engine=key[-1])
+    for name, seconds in forecast.attrs.get("timings", {}).items():
+        observe(name, seconds)
+    _remember_forecast(key, forecast)
+
+
+def _remember_forecast(key, forecast):
+    """A function to add a forecast to the LRU cache, evicting the least recently used forecasts beyond `MAX_CACHED_FORECASTS`."""
+
+    _forecasts[key] = shared(forecast)
+    _forecasts.move_to_end(key)
+    while len(_forecasts) > MAX_CACHED_FORECASTS:
+        _forecasts.popitem(last=False)
+
+
+def cached_forecast(key):
+    """A function to look up an already fitted forecast without starting a new fit. Returns None on a cache miss."""
+
+    global _hits, _misses
+    forecast = _forecasts.get(key)
+    if forecast is not None:
+        _forecasts.move_to_end(key)
+        _hits += 1
+    else:
+        _misses += 1
+    return forecast
+
+
+def cache_stats():
+    """A function to report the hits and misses of the forecast cache and the number of cached forecasts."""
+
+    return {"hits": _hits, "misses": _misses, "entries": len(_forecasts)}
+
+
+def precomputed_path(lat, lng, start_date, end_date, growth, root=PRECOMPUTED_DIR):
+    """A function to return the file holding the precomputed forecast of a location, training range and growth mode."""
+
+    return os.path.join(root, "{:.4f}_{:.4f}".format(lat, lng), "{}_{}_{}.npz".format(start_date, end_date, growth))
+
+
+def save_precomputed(path, forecast):
+    """A function to store the future part of a forecast fitted for `MAX_YEARS` years as compact float32 arrays."""
+
+    future = forecast.tail(365*MAX_YEARS)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, first_day=str(future['ds'].iloc[0].date()), **{column: future[column].values.astype(np.float32) for column in FORECAST_COLUMNS})
+    os.replace(tmp, path)
+
+
+def load_precomputed(path, history, years, units):
+    """A function to build a forecast frame from a precomputed file and the observed history, in the same layout as `fit_forecast`. Forecasts are stored in Celsius and converted for Fahrenheit. Returns None if nothing was precomputed or the horizon is longer than the `MAX_YEARS` that were."""
+
+    if int(years) > MAX_YEARS:
+        return None
+    days = 365*int(years)
+    try:
+        with np.load(path) as data:
+            future = pd.DataFrame({"ds": pd.date_range(str(data['first_day']), periods=days, freq="D")})
+            for column in FORECAST_COLUMNS:
+                values = data[column][:days].astype(np.float64)
+                future[column] = values * 9 / 5 + 32 if units == "F" else values
+    except FileNotFoundError:
+        return None
+
+    observed = history.rename(columns={'date': 'ds', 'temperature_2m_min': 'y'})
+    observed['ds'] = pd.to_datetime(observed['ds'])
+    return pd.concat([observed, future], ignore_index=True)
+
+
+async def get_forecast(history, lat, lng, start_date, end_date, growth, years, units, engine="prophet"):
+    """A function to return the forecast for a location, training range, growth mode, horizon, units and engine. In the precomputed mode, Prophet forecasts are read from `PRECOMPUTED_DIR` when available. Otherwise fast engines are fitted in-process and slow ones in the process pool on a cache miss. Concurrent callers with the same selection share one fit. When every caller waiting on a fit has been cancelled, the fit is cancelled too if it has not started yet."""
+
+    key = (lat, lng, start_date, end_date, growth, years, units, engine)
+    forecast = cached_forecast(key)
+    if forecast is not None:
+        return forecast
+
+    if not ENGINES[engine].use_process_pool:
+        with span("forecast_fit", engine=engine):
+            forecast = fit_forecast(history, growth, years, engine)
+        _remember_forecast(key, forecast)
+        return forecast
+
+    if FORECAST_MODE == "precomputed" and engine == "prophet":
+        forecast = load_precomputed(precomputed_path(lat, lng, start_date, end_date, growth), history, years, units)
+        if forecast is not None:
+            _remember_forecast(key, forecast)
+            return forecast
+
+    fit = _pending.get(key)
+    if fit is None:
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        fit = _get_executor().submit(fit_forecast, history, growth, years, engine)
+        fit.add_done_callback(lambda f: loop.call_soon_threadsafe(_store_forecast, key, f, submitted))
+        _pending[key] = fit
+        _waiters[key] = 0
+
+    _waiters[key] += 1
+    try:
+        return await asyncio.shield(asyncio.wrap_future(fit))
+    except asyncio.CancelledError:
+        _waiters[key] -= 1
+        if _waiters[key] == 0:
+            # Nobody is waiting on this fit any more: drop it before it starts, or let it finish into the cache.
+            _pending.pop(key, None)
+            _waiters.pop(key, None)
+            fit.cancel()
+        raise
+
+
+def plot_forecast(forecast, years, ylabel, threshold):
+    """A function to plot a forecast frame in the same style as `Prophet.plot`: the observed temperatures as points and the predicted years as a line with its uncertainty interval, with the plot temperature threshold as a horizontal line. The figure is not registered with pyplot, so it can be rendered from any session."""
+
+    from matplotlib.dates import AutoDateLocator, AutoDateFormatter
+    from matplotlib.figure import Figure
+
+    history = forecast[forecast['y'].notna()]
+    future = forecast.tail(365*int(years))
+
+    fig = Figure(facecolor='w')
+    ax = fig.add_subplot(111)
+    ax.plot(history['ds'], history['y'], 'k.', label='Observed data points')
+    ax.plot(future['ds'], future['yhat'], ls='-', c='#0072B2', label='Forecast')
+    ax.fill_between(future['ds'], future['yhat_lower'], future['yhat_upper'], color='#0072B2', alpha=0.2, label='Uncertainty interval')
+    locator = AutoDateLocator(interval_multiples=False)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(AutoDateFormatter(locator))
+    ax.grid(True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+    ax.set_xlabel('')
+    ax.set_ylabel(ylabel)
+    ax.axhline(y=threshold, color='#A9A9A9')
+    return fig
@@ -0,0 +1,205 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Load test of the dashboard: drives many concurrent sessions on one server process through random but realistic input
+sequences and reports the throughput and tail latency of the server. Every session opens the dashboard and then
+repeatedly waits a think time and performs one action:
+
+- picks one of the most populous cities,
+- drags the plot or table temperature slider, sending a value every 50 ms as a browser does,
+- switches between the Historical and Forecast tabs,
+- switches the temperature units, the date range, the rolling averages, the daily or hourly resolution or the forecast
+  model.
+
+The latency of an action is the time from its last input message until the last output it changed shows its new value.
+The app starts cold, with the API replayed by replay_server.py, so runs with the same --seed send the same actions.
+
+Usage:
+    python load-test.py --sessions 20 --actions 30 --synthetic
+    python load-test.py --sessions 50 --think 2 --json load-tests.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import numpy as np
+from cities import CITY_CSV, CITY_DATA, CityCatalog
+from replay_server import start_server
+from shiny_client import APP_DIR, AppServer, ShinySession, initial_inputs, tab_inputs
+
+
+# Relative weights of the actions a session picks from.
+ACTIONS = {"city": 4, "plot slider": 4, "table slider": 2, "tab": 3, "units": 1, "dates": 1, "rolling averages": 1, "resolution": 1, "forecast model": 1}
+SLIDER_RANGES = {"F": (-15, 50), "C": (-25, 10)}
+DATE_RANGES = [["2022-01-01", "2024-01-01"], ["2020-01-01", "2024-01-01"], ["2023-01-01", "2024-01-01"]]
+DRAG_INTERVAL = 0.05
+
+
+def top_cities(n):
+    """A function to list the `n` most populous cities of the dashboard's catalog, or its first `n` cities if the catalog has no populations."""
+
+    catalog = CityCatalog.load(os.path.join(APP_DIR, CITY_DATA), os.path.join(APP_DIR, CITY_CSV))
+    if catalog.population is None:
+        return catalog.names[:n]
+    return [catalog.names[i] for i in np.argsort(catalog.population)[::-1][:n]]
+
+
+class SessionState:
+    """The inputs of one simulated browser, used to pick actions that make sense for what it currently shows."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.units = "F"
+        self.tab = "Historical"
+        self.rolling = False
+        self.resolution = "daily"
+        self.engine = "prophet"
+        self.threshold = 5
+
+    def drag(self, low, high, start):
+        """A function to generate the slider values a drag from `start` passes through, ending on a random value."""
+
+        end = self.rng.randint(low, high)
+        step = 1 if end >= start else -1
+        values = list(range(start, end + step, step))
+        return values[::max(len(values) // 8, 1)] + [end]
+
+    def next_action(self, cities):
+        """A function to pick the next action. Returns its name and the list of input messages to send."""
+
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        low, high = SLIDER_RANGES[self.units]
+        if action == "city":
+            return action, [{"city": self.rng.choice(cities)}]
+        if action == "plot slider":
+            values = self.drag(low, high, self.threshold)
+            self.threshold = values[-1]
+            return action, [{"plotTemperature": value} for value in values]
+        if action == "table slider":
+            lower = self.rng.randint(low, high - 10)
+            return action, [{"tableTemperature": [lower, lower + upper]} for upper in range(2, 11, 2)]
+        if action == "tab":
+            self.tab = "Forecast" if self.tab == "Historical" else "Historical"
+            return action, [tab_inputs(self.tab)]
+        if action == "units":
+            self.units = "C" if self.units == "F" else "F"
+            # The sliders are rendered again for the new units and send their default values.
+            self.threshold = -15 if self.units == "C" else 5
+            table = [-20, -10] if self.units == "C" else [0, 15]
+            return action, [{"units": self.units, "plotTemperature": self.threshold, "tableTemperature": table}]
+        if action == "dates":
+            return action, [{"dateRange:shiny.date": self.rng.choice(DATE_RANGES)}]
+        if action == "rolling averages":
+            self.rolling = not self.rolling
+            return action, [{"weeklyAvg": self.rolling, "monthlyAvg": self.rolling}]
+        if action == "resolution":
+            self.resolution = "hourly" if self.resolution == "daily" else "daily"
+            return action, [{"resolution": self.resolution}]
+        self.engine = "harmonic" if self.engine == "prophet" else "prophet"
+        return action, [{"forecastEngine": self.engine}]
+
+
+async def run_session(app, index, cities, args, results):
+    """A function to run one simulated browser: open the dashboard after its ramp-up delay, then perform `args.actions` actions with think times in between. Appends (action, latency or None, errors) to `results`."""
+
+    rng = random.Random(args.seed * 100003 + index)
+    state = SessionState(rng)
+    await asyncio.sleep(args.ramp * index / max(args.sessions, 1))
+    async with ShinySession(app.websocket_url, args.timeout) as session:
+        renders, errors = await session.init(initial_inputs(city=rng.choice(cities)))
+        results.append(("open", max(renders.values(), default=None), errors))
+        for _ in range(args.actions):
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+            action, messages = state.next_action(cities)
+            for message in messages[:-1]:
+                await session.send("update", message)
+                await asyncio.sleep(DRAG_INTERVAL)
+            try:
+                renders, errors = await session.update(messages[-1])
+            except TimeoutError as e:
+                results.append((action, None, {"timeout": str(e)}))
+                continue
+            results.append((action, max(renders.values(), default=None), errors))
+
+
+async def run_load(app, cities, args):
+    results = []
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(run_session(app, i, cities, args, results) for i in range(args.sessions)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    failed = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    return results, elapsed, failed
+
+
+def summarise(results, elapsed, failed, api_requests, memory):
+    """A function to summarise the load test: throughput, latency percentiles overall and per action, errors, API calls and the server's peak memory."""
+
+    def latency(values):
+        values = np.asarray(values) * 1000
+        if not len(values):
+            return {}
+        return {"count": len(values), "p50_ms": np.percentile(values, 50), "p95_ms": np.percentile(values, 95),
+                "p99_ms": np.percentile(values, 99), "max_ms": values.max()}
+
+    timed = [(action, seconds) for action, seconds, _ in results if seconds is not None]
+    return {
+        "actions": len(results),
+        "seconds": elapsed,
+        "actions_per_second": len(results) / elapsed,
+        "latency": latency([seconds for action, seconds in timed if action != "open"]),
+        "open": latency([seconds for action, seconds in timed if action == "open"]),
+        "per_action": {name: latency([seconds for action, seconds in timed if action == name]) for name in ACTIONS},
+        "errors": sum(bool(errors) for _, _, errors in results),
+        "failed_sessions": [repr(e) for e in failed],
+        "api_requests": api_requests,
+        "peak_memory_mb": memory,
+    }
+
+
+def print_summary(summary):
+    """A function to print the load test summary."""
+
+    print("{} actions in {:.1f}s: {:.2f} actions/s, {} with errors, {} sessions failed, {} API requests, peak memory {:.0f} MB".format(
+        summary["actions"], summary["seconds"], summary["actions_per_second"], summary["errors"], len(summary["failed_sessions"]),
+        summary["api_requests"], summary["peak_memory_mb"] or 0))
+    print("{:18s} {:>6s} {:>9s} {:>9s} {:>9s} {:>9s}".format("action", "count", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for name, timing in [("open", summary["open"]), ("all actions", summary["latency"])] + list(summary["per_action"].items()):
+        if timing:
+            print("{:18s} {:6d} {:9.0f} {:9.0f} {:9.0f} {:9.0f}".format(name, timing["count"], timing["p50_ms"], timing["p95_ms"], timing["p99_ms"], timing["max_ms"]))
+    for error in summary["failed_sessions"]:
+        print("session failed: {}".format(error))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive concurrent sessions on the dashboard and report throughput and tail latency.")
+    parser.add_argument("--sessions", type=int, default=10, help="number of concurrent sessions")
+    parser.add_argument("--actions", type=int, default=20, help="actions per session after opening the dashboard")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between actions in seconds")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which the sessions are opened")
+    parser.add_argument("--cities", type=int, default=50, help="number of most populous cities the sessions pick from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=180, help="seconds to wait for the outputs of one action")
+    parser.add_argument("--fixtures", default="fixtures/openmeteo", help="directory of recorded API responses")
+    parser.add_argument("--record", metavar="UPSTREAM_URL", help="record missing responses from this URL")
+    parser.add_argument("--synthetic", action="store_true", help="generate missing responses instead of recording them")
+    parser.add_argument("--json", metavar="PATH", help="also append the results as one JSON line to this file")
+    args = parser.parse_args()
+
+    cities = top_cities(args.cities)
+    replay = start_server(args.fixtures, args.record, synthetic=args.synthetic)
+    try:
+        with AppServer(replay.url, cold=True) as app:
+            results, elapsed, failed = asyncio.run(run_load(app, cities, args))
+            summary = summarise(results, elapsed, failed, replay.requests, app.memory()[1])
+    finally:
+        replay.shutdown()
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps({"time": time.time(), "sessions": args.sessions, "actions": args.actions, "think": args.think, "seed": args.seed, "summary": summary}) + "\n")
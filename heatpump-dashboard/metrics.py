@@ -0,0 +1,360 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Instrumentation of the dashboard's hot paths, exposed in the Prometheus text format on the /metrics route. It records:
+
+- Timing spans: every reactive calc, render and extended task in the server function (with the `traced` decorator),
+  plus the OpenMeteo requests, the Prophet fit and predict steps, the plot renders and the city catalog load.
+- Counters: calls and errors per span, upstream API requests and bytes, and the hits and misses of the plot cache,
+  the response cache, the in-memory weather and forecast caches.
+- Memory: the resident memory of the process, the open sessions, and the total and largest bytes held by the data
+  frames and arrays one session's calcs keep. An object is counted once per session however many calcs return it, and
+  objects held by the process-wide weather and forecast caches (marked with `shared`) are not counted at all. The
+  breakdown per session and calc is served as JSON on /metrics/sessions rather than in the scrape, where a label per
+  session would add a time series for every session ever opened. Sessions are numbered there, as Shiny's session IDs
+  also authorize the session's upload and download requests.
+
+Set METRICS=0 to leave the server functions unwrapped. With PROFILE_DIR set, every render (and every calc run outside
+a render) is also run under cProfile and the stats are written to that directory, one .prof file per call, for
+`python -m pstats` or snakeviz.
+"""
+
+import cProfile
+import functools
+import inspect
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+
+METRICS = os.environ.get("METRICS", "1") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+# Upper bounds of the span histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNTER_HELP = {
+    "upstream_requests_total": "Requests sent to the OpenMeteo API, by HTTP status.",
+    "upstream_bytes_total": "Bytes received from the OpenMeteo API.",
+}
+
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_sessions = {}
+_session_numbers = itertools.count(1)
+_shared = weakref.WeakValueDictionary()
+_profiling = threading.local()
+_profile_numbers = itertools.count()
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def observe(name, seconds, **labels):
+    """A function to record one timed call of the span `name`."""
+
+    with _lock:
+        span = _spans.get(_key(name, labels))
+        if span is None:
+            span = _spans[_key(name, labels)] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0, "errors": 0}
+        span["count"] += 1
+        span["sum"] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                span["buckets"][i] += 1
+
+
+def increment(name, amount=1, **labels):
+    """A function to add `amount` to the counter `name`."""
+
+    with _lock:
+        _counters[_key(name, labels)] = _counters.get(_key(name, labels), 0) + amount
+
+
+def _error(name, labels):
+    with _lock:
+        span = _spans.setdefault(_key(name, labels), {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0, "errors": 0})
+        span["errors"] += 1
+
+
+@contextmanager
+def span(name, **labels):
+    """A context manager to time a block as the span `name`. Blocks that raise are counted as errors of the span."""
+
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _error(name, labels)
+        raise
+    observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    """A decorator to time every call of a function as the span `name`."""
+
+    def wrapper(f):
+        @functools.wraps(f)
+        def timed_f(*args, **kwargs):
+            with span(name, **labels):
+                return f(*args, **kwargs)
+        return timed_f
+
+    return wrapper
+
+
+def _leaves(value):
+    """A function to yield the data frames, series and arrays in a value, looking into tuples, lists and dicts."""
+
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _leaves(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _leaves(item)
+
+
+def _size(leaf):
+    if isinstance(leaf, pd.DataFrame):
+        return int(leaf.memory_usage(index=True, deep=False).sum())
+    if isinstance(leaf, pd.Series):
+        return int(leaf.memory_usage(index=True, deep=False))
+    return leaf.nbytes
+
+
+def nbytes(value):
+    """A function to estimate the memory held by a calc result: the shallow size of data frames and series and the size of arrays, summed over tuples, lists and dicts. Other values count as 0."""
+
+    return sum(_size(leaf) for leaf in _leaves(value))
+
+
+def shared(value):
+    """A function to mark the data frames, series and arrays in a value as held by a process-wide cache, so sessions whose calcs return them are not charged for them. Returns the value."""
+
+    with _lock:
+        for leaf in _leaves(value):
+            _shared[id(leaf)] = leaf
+    return value
+
+
+def _current_session():
+    from shiny.session import get_current_session
+
+    session = get_current_session()
+    return session.id if session is not None else None
+
+
+def _record_result(name, value):
+    """A function to remember the objects, by id, and their bytes the current session's calc `name` holds, leaving out objects marked as `shared`."""
+
+    leaves = list(_leaves(value))
+    if not leaves:
+        return
+    session = _current_session()
+    with _lock:
+        if session in _sessions:
+            _sessions[session]["calcs"][name] = {id(leaf): _size(leaf) for leaf in leaves if _shared.get(id(leaf)) is not leaf}
+
+
+def _session_total(calcs):
+    """A function to add up the bytes of a session's calcs, counting an object returned by several calcs once."""
+
+    objects = {}
+    for sizes in calcs.values():
+        objects.update(sizes)
+    return sum(objects.values())
+
+
+def _profile_path(name):
+    session = re.sub(r"\W", "", str(_current_session()))[:8]
+    return os.path.join(PROFILE_DIR, "{}-{:06d}-{}-{}.prof".format(time.strftime("%Y%m%d-%H%M%S"), next(_profile_numbers), session, name))
+
+
+def traced(f):
+    """A decorator for the calcs, renders and extended tasks of the server function. Records a span named after the function, the bytes its result holds for the session and, in the profiling mode, a cProfile dump of every outermost call. Must be placed below the Shiny decorator, which then sees the original name."""
+
+    if not METRICS:
+        return f
+
+    from shiny.types import SilentException
+
+    name = f.__name__
+
+    if inspect.iscoroutinefunction(f):
+        @functools.wraps(f)
+        async def traced_f(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                value = await f(*args, **kwargs)
+            except SilentException:
+                raise
+            except Exception:
+                _error(name, {})
+                raise
+            observe(name, time.perf_counter() - started)
+            _record_result(name, value)
+            return value
+
+        return traced_f
+
+    @functools.wraps(f)
+    def traced_f(*args, **kwargs):
+        # Calcs run inside renders, and cProfile cannot be nested, so only the outermost call is profiled.
+        profile = None
+        if PROFILE_DIR and not getattr(_profiling, "active", False):
+            profile = cProfile.Profile()
+            _profiling.active = True
+            profile.enable()
+        started = time.perf_counter()
+        try:
+            value = f(*args, **kwargs)
+        except SilentException:
+            raise
+        except Exception:
+            _error(name, {})
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+                _profiling.active = False
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                profile.dump_stats(_profile_path(name))
+        observe(name, time.perf_counter() - started)
+        _record_result(name, value)
+        return value
+
+    return traced_f
+
+
+def track_session(session):
+    """A function to count a new session and drop its memory figures when it ends. Called at the top of the server function."""
+
+    with _lock:
+        _sessions[session.id] = {"number": next(_session_numbers), "calcs": {}}
+
+    def ended():
+        with _lock:
+            _sessions.pop(session.id, None)
+
+    session.on_ended(ended)
+
+
+def resident_memory():
+    """A function to read the resident memory of this process in bytes, from /proc where available and otherwise the peak from getrusage."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cache_stats():
+    """A function to gather the hit and miss counts of the dashboard's caches that are in use by this process."""
+
+    stats = {}
+    if "render_cache" in sys.modules:
+        stats["plots"] = sys.modules["render_cache"].plot_cache.stats()
+    weather = sys.modules.get("weather")
+    if weather is not None:
+        if weather.response_cache is not None:
+            stats["responses"] = weather.response_cache.stats()
+        info = weather.fetch_daily.cache_info()
+        stats["weather"] = {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
+        info = weather.fetch_hourly.cache_info()
+        stats["weather_hourly"] = {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
+    forecast = sys.modules.get("forecast")
+    if forecast is not None:
+        stats["forecasts"] = forecast.cache_stats()
+    return stats
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels) + "}"
+
+
+def exposition():
+    """A function to render every metric in the Prometheus text exposition format."""
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP heatpump_{} {}".format(name, help_text))
+        lines.append("# TYPE heatpump_{} {}".format(name, kind))
+        for suffix, labels, value in samples:
+            lines.append("heatpump_{}{}{} {}".format(name, suffix, _labels(labels), value))
+
+    with _lock:
+        spans = {key: dict(span, buckets=list(span["buckets"])) for key, span in _spans.items()}
+        counters = dict(_counters)
+        sessions = {session: _session_total(state["calcs"]) for session, state in _sessions.items()}
+
+    samples = []
+    errors = []
+    for (name, labels), span in sorted(spans.items()):
+        labels = (("name", name),) + labels
+        for bound, count in zip(BUCKETS, span["buckets"]):
+            samples.append(("_bucket", labels + (("le", bound),), count))
+        samples.append(("_bucket", labels + (("le", "+Inf"),), span["count"]))
+        samples.append(("_sum", labels, round(span["sum"], 6)))
+        samples.append(("_count", labels, span["count"]))
+        errors.append(("", labels, span["errors"]))
+    metric("span_seconds", "histogram", "Time spent in instrumented calcs, renders and hot paths.", samples)
+    metric("span_errors_total", "counter", "Calls of instrumented spans that raised an error.", errors)
+
+    for name in sorted({name for name, _ in counters}):
+        metric(name, "counter", COUNTER_HELP.get(name, name), [("", labels, value) for (n, labels), value in sorted(counters.items()) if n == name])
+
+    caches = cache_stats()
+    for stat in ("hits", "misses", "evictions", "expirations", "entries", "bytes"):
+        samples = [("", (("cache", cache),), values[stat]) for cache, values in sorted(caches.items()) if stat in values]
+        if samples:
+            if stat in ("entries", "bytes"):
+                metric("cache_" + stat, "gauge", "Current {} of the dashboard's caches.".format(stat), samples)
+            else:
+                metric("cache_{}_total".format(stat), "counter", "Cache {} since the process started.".format(stat), samples)
+
+    metric("process_resident_memory_bytes", "gauge", "Resident memory of the server process.", [("", (), resident_memory())])
+    metric("sessions", "gauge", "Open sessions.", [("", (), len(sessions))])
+    metric("session_memory_bytes", "gauge", "Bytes held by the data frames and arrays of the open sessions' calcs, in total and for the largest session.",
+           [("", (("stat", "sum"),), sum(sessions.values())), ("", (("stat", "max"),), max(sessions.values(), default=0))])
+    return "\n".join(lines) + "\n"
+
+
+def session_memory():
+    """A function to list the open sessions, largest first, by their number in order of opening: the bytes they hold in total and the bytes of every calc. An object returned by several calcs appears under each of them but counts once in the total."""
+
+    with _lock:
+        sessions = [(state["number"], _session_total(state["calcs"]), {name: sum(sizes.values()) for name, sizes in state["calcs"].items()})
+                    for state in _sessions.values()]
+    return {"session-{}".format(number): {"total": total, "calcs": calcs} for number, total, calcs in sorted(sessions, key=lambda s: -s[1])}
+
+
+async def metrics_endpoint(request):
+    """The Starlette endpoint of the /metrics route."""
+
+    from starlette.responses import PlainTextResponse
+
+    return PlainTextResponse(exposition(), media_type="text/plain; version=0.0.4")
+
+
+async def sessions_endpoint(request):
+    """The Starlette endpoint of the /metrics/sessions debug route."""
+
+    from starlette.responses import JSONResponse
+
+    return JSONResponse(session_memory())
@@ -0,0 +1,176 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+The historical plot and the rendering of plots to PNG for the render cache. The historical plot has two renderers:
+the plotnine `ggplot` the dashboard has always drawn, and a lighter one that draws the same plot directly with
+matplotlib and thins long series to the minimum and maximum of each few pixels, which keeps every cold day visible.
+Set PLOT_RENDERER=matplotlib to use the lighter renderer. plotnine, mizani and matplotlib are imported on the first plot
+rather than with the module, as they make up a large part of the dashboard's startup time.
+
+The hourly plot is always drawn with matplotlib, as an hourly series has 24 times the points of a daily one. It is
+decimated on the float32 Celsius values, so only the kept hours are converted to the selected units.
+"""
+
+import io
+import os
+import numpy as np
+import pandas as pd
+from metrics import span
+
+
+PLOT_RENDERER = os.environ.get("PLOT_RENDERER", "plotnine")
+# Resolution of the rendered plots in dots per CSS pixel inch, the same as Shiny's `render.plot` uses.
+PLOT_DPI = 100
+
+
+def decimate(values, max_points):
+    """A function to pick at most about `max_points` indices of a series for a scatter plot. The series is split into `max_points // 2` consecutive bins and the lowest and highest value of each bin are kept. Returns all indices when the series is short enough."""
+
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+
+    bins = max(max_points // 2, 1)
+    per_bin = -(-n // bins)
+    padded = np.full(bins * per_bin, np.nan, dtype=np.result_type(np.asarray(values).dtype, np.float32))
+    padded[:n] = values
+    padded = padded.reshape(bins, per_bin)
+    offsets = np.arange(bins) * per_bin
+    lowest = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highest = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    keep = np.unique(np.concatenate((lowest, highest)))
+    keep = keep[keep < n]
+    return keep[~np.isnan(np.asarray(values)[keep])]
+
+
+def hist_ggplot(daily_dataframe, threshold, units, weekly_avg, monthly_avg):
+    """A function to build the plotnine historical plot: the daily minimum temperatures coloured by the threshold, with optional weekly and monthly rolling averages."""
+
+    from plotnine import ggplot, aes, geom_point, theme, labs, scale_x_datetime, element_line, element_rect, geom_hline, geom_line, scale_color_manual
+    from mizani.breaks import date_breaks
+    from mizani.formatters import date_format
+
+    daily_dataframe = daily_dataframe.copy()
+    daily_dataframe['temp_category'] = np.where(daily_dataframe['temperature_2m_min'] < threshold, 'below', 'above')
+
+    p = (
+        ggplot(daily_dataframe, aes(x='date', y='temperature_2m_min', color='temp_category'))
+        + geom_point(alpha=0.9)
+        + labs(title='', x='', y='Daily Minimum Temperature °'+units)
+        +scale_x_datetime(
+        breaks=date_breaks('3 months'),
+        labels=date_format('%Y-%m'))
+        +scale_color_manual(values={'below': '#D3D3D3', 'above': 'black'})
+        + theme(
+        panel_background=element_rect(fill='white', colour='white'),
+        panel_border=element_rect(colour='#9E9E9E', fill=None, size=1),
+        plot_background=element_rect(color='white', size=2),
+        panel_grid_major=element_line(color='lightgrey', size=0.5),
+        legend_position="none"
+        )
+        +geom_hline(yintercept=threshold, color="#A9A9A9", size=0.5)
+
+    )
+
+    if weekly_avg:
+        p += geom_line(aes(y='weekly_avg',group=1),color="#FF8C00",size=0.9)
+
+    if monthly_avg:
+        p += geom_line(aes(y='monthly_avg',group=1),color="#1C90FF",size=0.9)
+
+    return p
+
+
+def hist_figure(daily_dataframe, threshold, units, weekly_avg, monthly_avg, max_points):
+    """A function to draw the historical plot directly with matplotlib, in the style of `hist_ggplot`. Series longer than `max_points` are decimated with `decimate`."""
+
+    from matplotlib.dates import DateFormatter, MonthLocator
+    from matplotlib.figure import Figure
+
+    dates = pd.to_datetime(daily_dataframe['date']).values
+    temps = daily_dataframe['temperature_2m_min'].values.astype(np.float64)
+    keep = decimate(temps, max_points)
+    below = temps[keep] < threshold
+
+    fig = Figure(facecolor='white')
+    ax = fig.add_subplot(111)
+    ax.plot(dates[keep][~below], temps[keep][~below], 'o', color='black', alpha=0.9, ms=3.5, mew=0)
+    ax.plot(dates[keep][below], temps[keep][below], 'o', color='#D3D3D3', alpha=0.9, ms=3.5, mew=0)
+    ax.axhline(threshold, color='#A9A9A9', lw=0.7)
+    if weekly_avg:
+        ax.plot(dates, daily_dataframe['weekly_avg'].values, color='#FF8C00', lw=1.3)
+    if monthly_avg:
+        ax.plot(dates, daily_dataframe['monthly_avg'].values, color='#1C90FF', lw=1.3)
+
+    ax.xaxis.set_major_locator(MonthLocator(bymonth=(1, 4, 7, 10)))
+    ax.xaxis.set_major_formatter(DateFormatter('%Y-%m'))
+    ax.grid(True, color='lightgrey', lw=0.5)
+    ax.set_axisbelow(True)
+    for spine in ax.spines.values():
+        spine.set_color('#9E9E9E')
+    ax.set_ylabel('Daily Minimum Temperature °'+units)
+    return fig
+
+
+def hourly_figure(hourly, threshold, units, weekly_avg, monthly_avg, max_points):
+    """A function to draw the hourly temperatures of a `weather.HourlyWeather` in the style of `hist_figure`, decimated to about `max_points` hours. The rolling averages are taken over the daily means of the hours."""
+
+    from matplotlib.dates import DateFormatter, MonthLocator
+    from matplotlib.figure import Figure
+
+    def convert(values):
+        values = values.astype(np.float64)
+        return values * 9 / 5 + 32 if units == "F" else values
+
+    keep = decimate(hourly.temperature, max_points)
+    times = hourly.start + keep.astype('timedelta64[h]')
+    temps = convert(hourly.temperature[keep])
+    below = temps < threshold
+
+    fig = Figure(facecolor='white')
+    ax = fig.add_subplot(111)
+    ax.plot(times[~below], temps[~below], 'o', color='black', alpha=0.9, ms=2.5, mew=0)
+    ax.plot(times[below], temps[below], 'o', color='#D3D3D3', alpha=0.9, ms=2.5, mew=0)
+    ax.axhline(threshold, color='#A9A9A9', lw=0.7)
+    if weekly_avg or monthly_avg:
+        days = len(hourly.temperature) // 24
+        daily_means = pd.Series(convert(np.nanmean(hourly.temperature[:days * 24].reshape(days, 24), axis=1)))
+        middays = hourly.start + np.arange(days).astype('timedelta64[D]') + np.timedelta64(12, 'h')
+        if weekly_avg:
+            ax.plot(middays, daily_means.rolling(window=7).mean().values, color='#FF8C00', lw=1.3)
+        if monthly_avg:
+            ax.plot(middays, daily_means.rolling(window=30).mean().values, color='#1C90FF', lw=1.3)
+
+    ax.xaxis.set_major_locator(MonthLocator(bymonth=(1, 4, 7, 10)))
+    ax.xaxis.set_major_formatter(DateFormatter('%Y-%m'))
+    ax.grid(True, color='lightgrey', lw=0.5)
+    ax.set_axisbelow(True)
+    for spine in ax.spines.values():
+        spine.set_color('#9E9E9E')
+    ax.set_ylabel('Hourly Temperature °'+units)
+    return fig
+
+
+def hist_plot(daily_dataframe, threshold, units, weekly_avg, monthly_avg, width):
+    """A function to build the historical plot with the renderer selected by PLOT_RENDERER. `width` is the output width in CSS pixels and sets how far the matplotlib renderer decimates."""
+
+    if PLOT_RENDERER == "matplotlib":
+        return hist_figure(daily_dataframe, threshold, units, weekly_avg, monthly_avg, max_points=int(width))
+    return hist_ggplot(daily_dataframe, threshold, units, weekly_avg, monthly_avg)
+
+
+def render_png(plot, width, height, pixelratio):
+    """A function to render a plotnine `ggplot` or a matplotlib `Figure` to PNG bytes at `width` x `height` CSS pixels, with `pixelratio` device pixels per CSS pixel."""
+
+    with io.BytesIO() as buf:
+        if hasattr(plot, "savefig"):
+            with span("render_png", renderer="matplotlib"):
+                plot.set_size_inches(width / PLOT_DPI, height / PLOT_DPI)
+                plot.set_layout_engine("tight")
+                plot.savefig(buf, format="png", dpi=PLOT_DPI * pixelratio)
+        else:
+            with span("render_png", renderer="plotnine"):
+                plot.save(buf, format="png", units="in", width=width / PLOT_DPI, height=height / PLOT_DPI, dpi=PLOT_DPI * pixelratio, verbose=False)
+        return buf.getvalue()
@@ -0,0 +1,72 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Precomputes the Prophet forecasts shown on the Forecast tab for every city and growth mode, using a process pool over
+all cores. Each city and growth mode is fitted once with a `MAX_YEARS` horizon; shorter horizons are the leading part of
+the same forecast. Run prefetch-data.py first so the training data is already in the local archive, then start the
+dashboard with FORECAST_MODE=precomputed to serve these files.
+
+Usage:
+    python precompute-forecasts.py --start 2022-01-01 --end 2024-01-01 --workers 8
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cities import CityCatalog
+from forecast import MAX_YEARS, PRECOMPUTED_DIR, fit_forecast, precomputed_path, save_precomputed
+from weather import fetch_daily
+
+
+def precompute_city(name, lat, lng, start_date, end_date, growth, output_dir):
+    """A function to fit and store the forecast of one city and growth mode. Runs in a worker process."""
+
+    logging.getLogger("cmdstanpy").disabled = True
+    history = fetch_daily(lat, lng, start_date, end_date).daily
+    forecast = fit_forecast(history, growth, MAX_YEARS)
+    save_precomputed(precomputed_path(lat, lng, start_date, end_date, growth, output_dir), forecast)
+    return name, growth
+
+
+def precompute(catalog, start_date, end_date, workers, output_dir):
+    """A function to precompute every city and growth mode that does not have a forecast file yet."""
+
+    jobs = []
+    for name in catalog.names:
+        lat, lng = catalog.coordinates(name)
+        for growth in ("flat", "linear"):
+            if not os.path.exists(precomputed_path(lat, lng, start_date, end_date, growth, output_dir)):
+                jobs.append((name, lat, lng, growth))
+    print("{} forecasts to fit with {} workers".format(len(jobs), workers or os.cpu_count()))
+
+    started = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(precompute_city, name, lat, lng, start_date, end_date, growth, output_dir) for name, lat, lng, growth in jobs]
+        for future in as_completed(futures):
+            try:
+                name, growth = future.result()
+            except Exception as e:
+                print("Forecast failed: {}".format(e))
+                continue
+            done += 1
+            if done % 50 == 0 or done == len(jobs):
+                elapsed = time.perf_counter() - started
+                print("{}/{} forecasts fitted ({:.2f}s per forecast)".format(done, len(jobs), elapsed / done))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute Prophet forecasts for every city and growth mode.")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date(2022, 1, 1), help="first day of the training range")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date(2024, 1, 1), help="last day of the training range")
+    parser.add_argument("--cities", default="data/cities.csv")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default=PRECOMPUTED_DIR)
+    args = parser.parse_args()
+
+    precompute(CityCatalog.from_csv(args.cities), args.start, args.end, args.workers, args.output)
@@ -0,0 +1,174 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Warms the dashboard's local weather archive for every city in data/cities.csv before users arrive. Cities are grouped
+into multi-location requests (the OpenMeteo archive API accepts lists of coordinates), batches run concurrently under a
+shared rate limit with retries and exponential backoff, and finished cities are checkpointed so an interrupted run
+resumes where it stopped.
+
+Usage:
+    python prefetch-data.py --start 2020-01-01 --end 2024-01-01 --batch-size 50 --workers 4 --rate 60
+    python prefetch-data.py --url http://127.0.0.1:8080/v1/archive   # against replay_server.py
+"""
+
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import openmeteo_requests
+import requests
+from cache import TimeoutAdapter
+from cities import CityCatalog
+from weather import REQUEST_TIMEOUT, archive, url as default_url
+
+
+class RateLimiter:
+    """Spaces out requests from all worker threads so that at most `rate` requests are started per minute."""
+
+    def __init__(self, rate):
+        self.interval = 60.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+def load_checkpoint(path, start_date, end_date):
+    """A function to read the set of cities already prefetched for this date range. A checkpoint written for a different range is ignored."""
+
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return set()
+    if checkpoint.get("start") != start_date.isoformat() or checkpoint.get("end") != end_date.isoformat():
+        return set()
+    return set(checkpoint.get("done", []))
+
+
+def save_checkpoint(path, start_date, end_date, done):
+    """A function to atomically write the set of finished cities."""
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"start": start_date.isoformat(), "end": end_date.isoformat(), "done": sorted(done)}, f)
+    os.replace(tmp, path)
+
+
+_local = threading.local()
+
+
+def _client():
+    """A function to return the OpenMeteo client of the current worker thread, each with its own pooled HTTP session. Every request gets `weather.REQUEST_TIMEOUT`, so a stalled connection fails and is retried instead of blocking its worker forever."""
+
+    if not hasattr(_local, "client"):
+        session = requests.Session()
+        adapter = TimeoutAdapter(REQUEST_TIMEOUT)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.client = openmeteo_requests.Client(session=session)
+    return _local.client
+
+
+def fetch_batch(batch, url, start_date, end_date):
+    """A function to request the daily minimum temperatures of a batch of (name, lat, lng) cities in one multi-location request and store each location in the archive. Returns the names that were stored."""
+
+    params = {
+        "latitude": ",".join(str(lat) for _, lat, _ in batch),
+        "longitude": ",".join(str(lng) for _, _, lng in batch),
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "daily": "temperature_2m_min",
+        "temperature_unit": "celsius",
+    }
+    responses = _client().weather_api(url, params=params)
+
+    stored = []
+    for response in responses:
+        name, lat, lng = batch[response.LocationId()]
+        values = np.asarray(response.Daily().Variables(0).ValuesAsNumpy(), dtype=np.float32)
+        archive.store(lat, lng, start_date, response.Latitude(), response.Longitude(), values)
+        stored.append(name)
+    return stored
+
+
+def fetch_with_retry(batch, url, start_date, end_date, limiter, retries, backoff):
+    """A function to fetch a batch under the rate limit, retrying failed requests with exponential backoff."""
+
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return fetch_batch(batch, url, start_date, end_date)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print("Batch starting with {} failed ({}), retrying in {:.1f}s".format(batch[0][0], e, delay))
+            time.sleep(delay)
+
+
+def prefetch(catalog, url, start_date, end_date, batch_size, workers, rate, retries, backoff, checkpoint_path):
+    """A function to prefetch every city of the catalog that is not yet in the archive for the date range. Returns the number of cities fetched."""
+
+    done = load_checkpoint(checkpoint_path, start_date, end_date)
+    todo = []
+    for name in catalog.names:
+        if name in done:
+            continue
+        lat, lng = catalog.coordinates(name)
+        if archive.missing_spans(lat, lng, start_date, end_date):
+            todo.append((name, lat, lng))
+        else:
+            done.add(name)
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    print("{} cities to fetch in {} batches ({} already archived)".format(len(todo), len(batches), len(done)))
+
+    limiter = RateLimiter(rate)
+    fetched = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fetch_with_retry, batch, url, start_date, end_date, limiter, retries, backoff) for batch in batches]
+        for future in as_completed(futures):
+            try:
+                stored = future.result()
+            except Exception as e:
+                failed += 1
+                print("Batch failed after {} retries: {}".format(retries, e))
+                continue
+            fetched += len(stored)
+            done.update(stored)
+            save_checkpoint(checkpoint_path, start_date, end_date, done)
+            print("{}/{} cities fetched".format(fetched, len(todo)))
+
+    if failed:
+        print("{} batches failed; run again to resume".format(failed))
+    return fetched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prefetch daily temperatures for every city into the local weather archive.")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date(2020, 1, 1))
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date(2024, 1, 1))
+    parser.add_argument("--cities", default="data/cities.csv")
+    parser.add_argument("--url", default=default_url, help="archive API endpoint, e.g. a local replay_server.py")
+    parser.add_argument("--batch-size", type=int, default=50, help="locations per request")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent requests")
+    parser.add_argument("--rate", type=float, default=60, help="maximum requests per minute (0 for no limit)")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=1.0, help="initial retry delay in seconds, doubled on every retry")
+    parser.add_argument("--checkpoint", default="data/prefetch-checkpoint.json")
+    args = parser.parse_args()
+
+    prefetch(CityCatalog.from_csv(args.cities), args.url, args.start, args.end, args.batch_size, args.workers, args.rate, args.retries, args.backoff, args.checkpoint)
@@ -3,17 +3,158 @@ Bhavana Sundar (bsundar3)
 CS 498 - End to End Data Science
 University of Illinois Urbana-Champaign
 
+Builds the city data used by the dashboard from the SimpleMaps spreadsheet: every US city with at least 10,000 people.
+The spreadsheet is streamed row by row with openpyxl's read-only reader, and the build is skipped when the spreadsheet's
+checksum matches the one recorded by the previous build. Two outputs are written:
+
+- data/cities.csv, the `city_state, lat, lng` text file the dashboard has always used.
+- data/cities/, a columnar copy with one .npy file per column that the dashboard memory-maps at startup: the names,
+  float32 coordinates, int32 populations, and the states and counties as integer codes into sorted category arrays.
+
+Usage:
+    python process-data.py
+    python process-data.py --force --benchmark
 """
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import openpyxl
 import pandas as pd
+from cities import CITY_CSV, CITY_DATA, CityCatalog
+
+
+MIN_POPULATION = 10000
+COLUMNS = ['city', 'state_name', 'county_name', 'lat', 'lng', 'population']
+
+
+def file_checksum(path):
+    """A function to compute the SHA-256 checksum of a file, read in chunks."""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_cities(input_file, min_population=MIN_POPULATION):
+    """A function to stream the spreadsheet with openpyxl's read-only reader and keep the cities with at least `min_population` people. Returns a dict of column lists."""
+
+    workbook = openpyxl.load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows)
+        positions = [header.index(column) for column in COLUMNS]
+        population = header.index('population')
+        columns = {column: [] for column in COLUMNS}
+        for row in rows:
+            if row[population] is None or row[population] < min_population:
+                continue
+            for column, i in zip(COLUMNS, positions):
+                columns[column].append(row[i])
+    finally:
+        workbook.close()
+    return columns
+
+
+def encode_categories(values):
+    """A function to encode a list of strings as (sorted categories, integer codes) using the smallest unsigned integer type that fits."""
 
-def process_data(input_file):
+    categories, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    dtype = np.uint8 if len(categories) <= 256 else np.uint16
+    return categories, codes.astype(dtype)
 
+
+def write_columns(output_dir, arrays, meta):
+    """A function to write every column as a .npy file plus meta.json into a fresh directory, which then replaces `output_dir` so the dashboard never sees a half-written build."""
+
+    tmp = output_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, name + ".npy"), array)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp, output_dir)
+
+
+def process_data(input_file, output_dir=CITY_DATA, csv_path=CITY_CSV, min_population=MIN_POPULATION, force=False):
+    """A function to rebuild the city outputs from the spreadsheet, unless the spreadsheet is unchanged since the last build. Returns True if the outputs were rebuilt."""
+
+    checksum = file_checksum(input_file)
+    try:
+        with open(os.path.join(output_dir, "meta.json")) as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = {}
+    if not force and previous.get("source_sha256") == checksum and previous.get("min_population") == min_population and os.path.exists(csv_path):
+        print("{} is unchanged, skipping the build".format(input_file))
+        return False
+
+    columns = read_cities(input_file, min_population)
+    df = pd.DataFrame(columns)
+    df['city_state'] = df['city'] + ", " + df['state_name']
+    df = df.drop_duplicates(subset=['city_state', 'lat', 'lng'])
+    df[['city_state', 'lat', 'lng']].to_csv(csv_path, index=False)
+
+    states, state_codes = encode_categories(df['state_name'])
+    counties, county_codes = encode_categories(df['county_name'])
+    arrays = {
+        "names": df['city_state'].values.astype(str),
+        "lat": df['lat'].values.astype(np.float32),
+        "lng": df['lng'].values.astype(np.float32),
+        "population": df['population'].values.astype(np.int32),
+        "state": state_codes,
+        "states": states,
+        "county": county_codes,
+        "counties": counties,
+    }
+    meta = {"source": os.path.basename(input_file), "source_sha256": checksum, "min_population": min_population, "rows": len(df)}
+    write_columns(output_dir, arrays, meta)
+    print("Wrote {} cities to {} and {}".format(len(df), csv_path, output_dir))
+    return True
+
+
+def benchmark(input_file, output_dir=CITY_DATA, csv_path=CITY_CSV, repeat=20):
+    """A function to compare the build time of the streaming reader with `pandas.read_excel`, and the dashboard's load time from the columnar files with the CSV."""
+
+    started = time.perf_counter()
     df = pd.read_excel(input_file)
-    df_filtered = df[df['population'] >= 10000]
-    df_filtered['city_state'] = df_filtered['city'] + ", " + df_filtered['state_name']
-    df_final = df_filtered[['city_state', 'lat', 'lng']].drop_duplicates()
-    df_final.to_csv('data/cities.csv', index=False)
+    df = df[df['population'] >= MIN_POPULATION]
+    print("build, pandas.read_excel:        {:8.1f} ms".format((time.perf_counter() - started) * 1000))
+    started = time.perf_counter()
+    read_cities(input_file)
+    print("build, openpyxl read-only:       {:8.1f} ms".format((time.perf_counter() - started) * 1000))
+    started = time.perf_counter()
+    file_checksum(input_file)
+    print("build skipped, checksum only:    {:8.1f} ms".format((time.perf_counter() - started) * 1000))
+
+    for label, load in (("load, CSV catalog:", lambda: CityCatalog.from_csv(csv_path)),
+                        ("load, memory-mapped catalog:", lambda: CityCatalog.from_npy(output_dir)),
+                        ("load, CSV columns only:", lambda: pd.read_csv(csv_path)),
+                        ("load, memory-mapped columns only:", lambda: [np.load(os.path.join(output_dir, name + ".npy"), mmap_mode="r") for name in ("names", "lat", "lng")])):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            load()
+        print("{:32s} {:8.2f} ms".format(label, (time.perf_counter() - started) * 1000 / repeat))
+
 
 if __name__ == "__main__":
-    input_file = 'data-raw/uscities.xlsx'
-    process_data(input_file)
+    parser = argparse.ArgumentParser(description="Build the dashboard's city data from the SimpleMaps spreadsheet.")
+    parser.add_argument("--input", default="data-raw/uscities.xlsx")
+    parser.add_argument("--output", default=CITY_DATA, help="directory for the columnar .npy files")
+    parser.add_argument("--csv", default=CITY_CSV)
+    parser.add_argument("--min-population", type=int, default=MIN_POPULATION)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the spreadsheet is unchanged")
+    parser.add_argument("--benchmark", action="store_true", help="time the build and the dashboard's load against the CSV path")
+    args = parser.parse_args()
+
+    process_data(args.input, args.output, args.csv, args.min_population, args.force)
+    if args.benchmark:
+        benchmark(args.input, args.output, args.csv)
@@ -0,0 +1,99 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Profiles the dashboard's cold start, so startup regressions can be tracked between releases. Three things are measured,
+each in a fresh Python process:
+
+- Per-module import times of `import app`, from `python -X importtime`, and which heavy libraries were imported
+  eagerly although the dashboard loads them lazily.
+- Time until a newly started server answers the first page request.
+- Time-to-first-render of every output for one session with the default inputs.
+
+Point --url at replay_server.py to profile without network access.
+
+Usage:
+    python profile-startup.py
+    python profile-startup.py --url http://127.0.0.1:8080/v1/archive --json startup-profile.json
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from shiny_client import OUTPUTS, AppServer, ShinySession, initial_inputs
+from warmup import HEAVY_MODULES, POOL_MODULES
+
+
+def import_profile(top):
+    """A function to import the app in a fresh interpreter with `-X importtime`. Returns the total import time, the `top` slowest modules imported directly by the app's own modules, and the heavy modules that were imported eagerly."""
+
+    code = "import sys, app; print(' '.join(m for m in {!r} if m in sys.modules))".format(HEAVY_MODULES + POOL_MODULES)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    total = time.perf_counter() - started
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(cumulative) / 1e6, depth, name.strip()))
+    # Depth 1 is the app itself and depth 2 the modules it imports; deeper imports are included in those times.
+    direct = sorted((m for m in modules if m[1] <= 2), reverse=True)[:top]
+    eager = result.stdout.split()
+    return total, [(name, seconds) for seconds, _, name in direct], eager
+
+
+async def first_renders(app, timeout):
+    """A function to open one session with the default inputs and every output visible, and record when each output receives its value, in seconds after the session's init message."""
+
+    inputs = initial_inputs()
+    for name in OUTPUTS:
+        inputs[".clientdata_output_{}_hidden".format(name)] = False
+    async with ShinySession(app.websocket_url, timeout) as session:
+        return await session.init(inputs)
+
+
+def serve_profile(url, timeout):
+    """A function to start the app in a new server process and time its first page and the first render of every output. Returns (seconds to the first page, renders, errors)."""
+
+    with AppServer(url) as app:
+        renders, errors = asyncio.run(first_renders(app, timeout))
+    return app.startup_seconds, renders, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the dashboard's import time and time-to-first-render.")
+    parser.add_argument("--url", help="archive API endpoint for the app, e.g. a local replay_server.py")
+    parser.add_argument("--top", type=int, default=15, help="number of modules to list")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for the first renders")
+    parser.add_argument("--json", metavar="PATH", help="also append the results as one JSON line to this file")
+    args = parser.parse_args()
+
+    total, modules, eager = import_profile(args.top)
+    print("import app: {:.2f}s".format(total))
+    for name, seconds in modules:
+        print("  {:40s} {:7.3f}s".format(name, seconds))
+    print("heavy modules imported at startup: {}".format(", ".join(eager) or "none"))
+
+    first_page, renders, errors = serve_profile(args.url, args.timeout)
+    print("\nfirst page served: {:.2f}s after the server process started".format(first_page))
+    for name in OUTPUTS:
+        if name in renders:
+            print("  {:24s} {:7.2f}s".format(name, renders[name]))
+        elif name in errors:
+            print("  {:24s} error: {}".format(name, errors[name]))
+        else:
+            print("  {:24s} no render".format(name))
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps({"time": time.time(), "import_seconds": total, "modules": dict(modules), "eager_modules": eager,
+                                "first_page_seconds": first_page, "first_render_seconds": renders, "errors": sorted(errors)}) + "\n")
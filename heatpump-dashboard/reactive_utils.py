@@ -0,0 +1,56 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Reactive helpers for the dashboard server. The debounce decorator is adapted from the debounce example in the
+Shiny for Python repository: https://github.com/posit-dev/py-shiny/blob/main/examples/event/app.py
+"""
+
+import time
+from shiny import reactive
+
+
+def debounce(delay_secs):
+    """A decorator to debounce a reactive expression: the returned calc only updates once its input has stopped changing for `delay_secs` seconds, so dragging a slider produces a single downstream recompute. Must be used inside the server function."""
+
+    def wrapper(f):
+        when = reactive.Value(None)
+        trigger = reactive.Value(0)
+
+        @reactive.Calc()
+        def cached():
+            return f()
+
+        @reactive.Effect(priority=102)
+        def primer():
+            """Restart the timer every time the wrapped expression is invalidated."""
+            try:
+                cached()
+            except Exception:
+                ...
+            finally:
+                when.set(time.time() + delay_secs)
+
+        @reactive.Effect(priority=101)
+        def timer():
+            """Fire the trigger once the deadline has passed without another change."""
+            deadline = when()
+            if deadline is None:
+                return
+            time_left = deadline - time.time()
+            if time_left <= 0:
+                with reactive.isolate():
+                    when.set(None)
+                    trigger.set(trigger() + 1)
+            else:
+                reactive.invalidate_later(time_left)
+
+        @reactive.Calc()
+        @reactive.event(trigger, ignore_none=False)
+        def debounced():
+            return cached()
+
+        return debounced
+
+    return wrapper
@@ -0,0 +1,131 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+A cache of rendered plots shared by every session. Each rendered PNG is stored on disk under a hash of its key (a
+fingerprint of the plotted data plus every display option and the output size), so popular cities are drawn once and
+then served straight from the file. The directory is kept under a byte budget by removing the least recently used
+files first.
+
+Shiny reads an image output's file only after the render function has returned, by which time another worker may
+have evicted it. Lookups therefore return a private hard link to the cached file, which the image output deletes once
+it has read it (`render.image(delete_file=True)`), and eviction only ever removes the cache's own name for the file.
+"""
+
+import hashlib
+import itertools
+import os
+import threading
+import numpy as np
+
+
+PLOT_CACHE_DIR = "data/plots"
+MAX_PLOT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def fingerprint(*arrays):
+    """A function to hash the contents of one or more arrays (or Series), so equal data from different sessions gives the same key."""
+
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(np.asarray(array))
+        digest.update(str((array.dtype, array.shape)).encode())
+        digest.update(array.tobytes() if array.dtype != object else repr(array.tolist()).encode())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Rendered PNG files under `root`, keyed by any tuple of hashable display options and evicted least recently used first once they take more than `max_bytes`."""
+
+    def __init__(self, root=PLOT_CACHE_DIR, max_bytes=MAX_PLOT_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = None
+
+    def path(self, key):
+        """A function to return the file that holds the rendering of `key`."""
+
+        return os.path.join(self.root, hashlib.sha1(repr(key).encode()).hexdigest() + ".png")
+
+    def _serving_path(self):
+        """A function to return a new, unique path for a private link handed to an image output."""
+
+        serving_dir = os.path.join(self.root, "serving")
+        os.makedirs(serving_dir, exist_ok=True)
+        return os.path.join(serving_dir, "{}-{}-{}.png".format(os.getpid(), threading.get_ident(), next(_serving_numbers)))
+
+    def get(self, key):
+        """A function to look up a rendered plot. Returns the path of a private link to its PNG file, which the caller must delete after reading, or None on a miss. A hit refreshes the file's modification time, which is what eviction orders by."""
+
+        path = self.path(key)
+        serving = self._serving_path()
+        try:
+            os.link(path, serving)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return serving
+
+    def put(self, key, png):
+        """A function to store the PNG bytes of a rendered plot and return the path of a private link to it, like `get`, evicting old renderings if the cache is over its byte budget."""
+
+        path = self.path(key)
+        serving = self._serving_path()
+        with open(serving, "wb") as f:
+            f.write(png)
+        tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        os.link(serving, tmp)
+        os.replace(tmp, path)
+
+        if self._bytes is None:
+            self._bytes = self._scan()[1]
+        else:
+            self._bytes += len(png)
+        if self._bytes > self.max_bytes:
+            self._evict()
+        return serving
+
+    def _scan(self):
+        """A function to list the cached files as (mtime, size, path), oldest first, together with their total size."""
+
+        files = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.endswith(".png"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        return files, sum(size for _, size, _ in files)
+
+    def _evict(self):
+        """A function to remove the least recently used files until the cache is back under three quarters of its budget, so eviction does not run on every new plot. The directory is rescanned because other worker processes share it."""
+
+        files, total = self._scan()
+        for _, size, path in files:
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+    def stats(self):
+        """A function to report the hit, miss and eviction counts of this process and the size of the cache."""
+
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "bytes": self._bytes or 0}
+
+
+_serving_numbers = itertools.count()
+plot_cache = RenderCache()
@@ -0,0 +1,157 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+A local stub of the OpenMeteo archive API that replays recorded FlatBuffer responses, so the prefetch job, the
+benchmarks and the dashboard can be exercised without network access. Responses are stored one file per request, named
+by a hash of the query string. With an upstream URL the server also records: unknown requests are forwarded and the
+response is saved. With --synthetic, unknown requests are answered with generated temperatures (a seasonal cycle plus
+noise, deterministic per location) and saved the same way, for machines without network access at all.
+
+Usage:
+    python replay_server.py fixtures/openmeteo --port 8080
+    python replay_server.py fixtures/openmeteo --record https://archive-api.open-meteo.com/v1/archive
+    python replay_server.py fixtures/openmeteo --synthetic
+"""
+
+import argparse
+import datetime
+import hashlib
+import os
+import threading
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import flatbuffers
+import numpy as np
+
+
+def request_key(query):
+    """A function to derive the fixture name of a request from its query string. Parameters are sorted, so the order in which a client sends them does not matter."""
+
+    params = sorted(urllib.parse.parse_qsl(query, keep_blank_values=True))
+    return hashlib.sha1(urllib.parse.urlencode(params).encode()).hexdigest()
+
+
+def _variables_with_time(builder, values, start, interval):
+    """A function to add a `VariablesWithTime` table holding one variable with `values`, the first at unix time `start`, to a FlatBuffer under construction."""
+
+    vector = builder.CreateNumpyVector(values)
+    builder.StartObject(12)                              # VariableWithValues
+    builder.PrependUOffsetTRelativeSlot(3, vector, 0)    # values
+    variable = builder.EndObject()
+    builder.StartVector(4, 1, 4)
+    builder.PrependUOffsetTRelative(variable)
+    variables = builder.EndVector()
+    builder.StartObject(4)                               # VariablesWithTime
+    builder.PrependInt64Slot(0, start, 0)                # time
+    builder.PrependInt64Slot(1, start + len(values) * interval, 0)  # time_end
+    builder.PrependInt32Slot(2, interval, 0)             # interval
+    builder.PrependUOffsetTRelativeSlot(3, variables, 0) # variables
+    return builder.EndObject()
+
+
+def synthetic_response(query):
+    """A function to build a size-prefixed `WeatherApiResponse` for every location of a query, with generated Celsius temperatures for its `daily` or `hourly` variable."""
+
+    params = dict(urllib.parse.parse_qsl(query))
+    start_date = datetime.date.fromisoformat(params["start_date"])
+    end_date = datetime.date.fromisoformat(params["end_date"])
+    start = int(datetime.datetime.combine(start_date, datetime.time(), datetime.timezone.utc).timestamp())
+    hourly = "hourly" in params
+    interval = 3600 if hourly else 86400
+    steps = ((end_date - start_date).days + 1) * 86400 // interval
+
+    body = b""
+    for location_id, (lat, lng) in enumerate(zip(params["latitude"].split(","), params["longitude"].split(","))):
+        lat, lng = float(lat), float(lng)
+        rng = np.random.default_rng(int(abs(lat * 1000)) * 100003 + int(abs(lng * 1000)))
+        days = (start + np.arange(steps) * interval) / 86400.0
+        values = 10 - lat / 4 - 12 * np.cos(2 * np.pi * (days - 15) / 365.25) + rng.normal(0, 4, steps)
+        if hourly:
+            values += 4 * np.sin(2 * np.pi * (days % 1 - 0.375))
+        builder = flatbuffers.Builder(steps * 4 + 256)
+        series = _variables_with_time(builder, values.astype(np.float32), start, interval)
+        builder.StartObject(14)                          # WeatherApiResponse
+        builder.PrependFloat32Slot(0, lat, 0)            # latitude
+        builder.PrependFloat32Slot(1, lng, 0)            # longitude
+        builder.PrependInt64Slot(4, location_id, 0)      # location_id
+        builder.PrependUOffsetTRelativeSlot(11 if hourly else 10, series, 0)  # hourly / daily
+        builder.FinishSizePrefixed(builder.EndObject())
+        body += bytes(builder.Output())
+    return body
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serves `<fixtures_dir>/<request_key>.fb` for every GET request, recording from `upstream` or generating a synthetic response when one of them is enabled."""
+
+    def do_GET(self):
+        server = self.server
+        query = urllib.parse.urlsplit(self.path).query
+        path = os.path.join(server.fixtures_dir, request_key(query) + ".fb")
+        with server.lock:
+            server.requests += 1
+
+        if not os.path.exists(path) and (server.upstream or server.synthetic):
+            if server.upstream:
+                with urllib.request.urlopen(server.upstream + "?" + query) as upstream:
+                    body = upstream.read()
+            else:
+                body = synthetic_response(query)
+            os.makedirs(server.fixtures_dir, exist_ok=True)
+            tmp = "{}.{}.tmp".format(path, threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+            with server.lock:
+                server.recorded += 1
+
+        if not os.path.exists(path):
+            self.send_error(404, "No recorded response for this request")
+            return
+
+        with open(path, "rb") as f:
+            body = f.read()
+        with server.lock:
+            server.bytes_sent += len(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(fixtures_dir, upstream=None, port=0, synthetic=False):
+    """A function to start the replay server on a background thread. The returned server exposes the archive endpoint as `server.url` and counts the `requests` and `bytes_sent` it has served and the responses it has `recorded`."""
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), ReplayHandler)
+    server.fixtures_dir = fixtures_dir
+    server.upstream = upstream
+    server.synthetic = synthetic
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.bytes_sent = 0
+    server.recorded = 0
+    server.url = "http://127.0.0.1:{}/v1/archive".format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded OpenMeteo archive responses.")
+    parser.add_argument("fixtures_dir")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--record", metavar="UPSTREAM_URL", help="forward unknown requests to this URL and save the responses")
+    parser.add_argument("--synthetic", action="store_true", help="answer unknown requests with generated temperatures and save them")
+    args = parser.parse_args()
+
+    server = start_server(args.fixtures_dir, args.record, args.port, args.synthetic)
+    print("Serving", args.fixtures_dir, "at", server.url)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
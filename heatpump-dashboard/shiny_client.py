@@ -0,0 +1,240 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+A minimal client for the dashboard's Shiny websocket protocol, shared by the startup profile, the output benchmark and
+the load test. `AppServer` runs the dashboard in a uvicorn subprocess, optionally in a fresh working directory so the
+weather archive, response cache and plot cache start cold, and `ShinySession` drives one browser session: it sends the
+same init and update messages the browser does and times when every output receives its new value.
+
+An input change is complete once the server has handled the inputs, no output is rendering or waiting for an extended
+task, and no output has changed for `settle` seconds, which covers the debounced sliders. Latencies are measured to the
+last new value, so the settle time is never counted.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import websockets
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUTS = ["getHistPlot", "getHistTable", "getForecastPlot", "getForecastTable", "loc_coords", "map", "plotTemperature", "tableTemperatureRange"]
+TAB_OUTPUTS = {
+    "Historical": ["getHistPlot", "getHistTable"],
+    "Forecast": ["getForecastPlot", "getForecastTable"],
+    "About": [],
+}
+DEFAULT_INPUTS = {
+    "city": "Urbana, Illinois",
+    "dateRange:shiny.date": ["2022-01-01", "2024-01-01"],
+    "yearsForecast": 1,
+    "getForecastPlot": "flat",
+    "forecastEngine": "prophet",
+    "units": "F",
+    "resolution": "daily",
+    "weeklyAvg": False,
+    "monthlyAvg": False,
+    "plotTemperature": 5,
+    "tableTemperature": [0, 15],
+    "navbar_id": "Historical",
+    ".clientdata_pixelratio": 1,
+}
+# Files the app needs at startup, linked into a cold working directory.
+APP_DATA = ["data/cities.csv", "data/cities"]
+
+
+def free_port():
+    """A function to ask the OS for an unused TCP port."""
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def tab_inputs(tab):
+    """A function to build the inputs a browser sends when it switches to `tab`: the navbar value and the hidden flags of the tab outputs, which Shiny uses to suspend hidden outputs."""
+
+    inputs = {"navbar_id": tab}
+    for name, outputs in TAB_OUTPUTS.items():
+        for output in outputs:
+            inputs[".clientdata_output_{}_hidden".format(output)] = name != tab
+    return inputs
+
+
+def initial_inputs(width=800, height=400, **overrides):
+    """A function to build the init message of a session with the default inputs, every output sized `width` x `height`, and the given inputs overridden."""
+
+    inputs = dict(DEFAULT_INPUTS)
+    for name in OUTPUTS:
+        inputs[".clientdata_output_{}_width".format(name)] = width
+        inputs[".clientdata_output_{}_height".format(name)] = height
+        inputs[".clientdata_output_{}_hidden".format(name)] = False
+    inputs.update(overrides)
+    inputs.update(tab_inputs(inputs["navbar_id"]))
+    return inputs
+
+
+class AppServer:
+    """The dashboard running in a uvicorn subprocess. With `cold=True` it runs in a temporary working directory holding only the city data, so nothing is cached from earlier runs. Use as a context manager."""
+
+    def __init__(self, url=None, cold=False, env=None):
+        self.url = url
+        self.cold = cold
+        self.env = env or {}
+        self.port = free_port()
+        self.workdir = None
+        self.process = None
+        self.startup_seconds = None
+
+    def __enter__(self):
+        env = dict(os.environ)
+        env.update(self.env)
+        if self.url:
+            env["OPENMETEO_URL"] = self.url
+        cwd = APP_DIR
+        if self.cold:
+            self.workdir = cwd = tempfile.mkdtemp(prefix="heatpump-")
+            os.makedirs(os.path.join(cwd, "data"))
+            for path in APP_DATA:
+                if os.path.exists(os.path.join(APP_DIR, path)):
+                    os.symlink(os.path.join(APP_DIR, path), os.path.join(cwd, path))
+
+        started = time.perf_counter()
+        self.process = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--app-dir", APP_DIR, "--port", str(self.port), "--log-level", "warning"],
+                                        cwd=cwd, env=env)
+        try:
+            while True:
+                if self.process.poll() is not None:
+                    raise RuntimeError("the app exited with code {}".format(self.process.returncode))
+                try:
+                    with urllib.request.urlopen("http://127.0.0.1:{}/".format(self.port)) as response:
+                        response.read()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        self.startup_seconds = time.perf_counter() - started
+        return self
+
+    def __exit__(self, *exc):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    @property
+    def websocket_url(self):
+        return "ws://127.0.0.1:{}/websocket/".format(self.port)
+
+    def memory(self):
+        """A function to read the resident memory of the server process in MB, now and at its peak, from /proc. Returns (None, None) where /proc is not available."""
+
+        try:
+            with open("/proc/{}/status".format(self.process.pid)) as f:
+                status = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            return None, None
+        return int(status["VmRSS"].split()[0]) / 1024, int(status["VmHWM"].split()[0]) / 1024
+
+
+class ShinySession:
+    """One browser session on the dashboard. `init` and `update` send the inputs and return a dict of output -> seconds until the output's last new value, and a dict of output -> error message."""
+
+    def __init__(self, websocket_url, timeout=120, settle=1.0):
+        self.websocket_url = websocket_url
+        self.timeout = timeout
+        self.settle = settle
+        self.ws = None
+        self.values = {}
+        self.hidden = set()
+        self._tag = 0
+
+    async def __aenter__(self):
+        self.ws = await websockets.connect(self.websocket_url, max_size=None)
+        await self.ws.recv()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.ws.close()
+
+    async def init(self, inputs):
+        return await self._send("init", inputs)
+
+    async def update(self, inputs):
+        return await self._send("update", inputs)
+
+    async def send(self, method, inputs):
+        """A function to send inputs without waiting for the outputs, as a browser does in the middle of a slider drag."""
+
+        for name, value in inputs.items():
+            if name.startswith(".clientdata_output_") and name.endswith("_hidden"):
+                output = name[len(".clientdata_output_"):-len("_hidden")]
+                (self.hidden.add if value else self.hidden.discard)(output)
+        await self.ws.send(json.dumps({"method": method, "data": inputs}))
+
+    async def _send(self, method, inputs):
+        started = time.perf_counter()
+        await self.send(method, inputs)
+        # The server handles a session's messages in order, so the response to this request arrives once the inputs have
+        # been applied and the outputs they invalidated have run. Other sessions' flushes also send this session (empty)
+        # values messages, so those cannot tell when the inputs were handled. An upload of no files is the only request
+        # that is answered without side effects or a server warning; its empty upload directory is removed when the
+        # session ends.
+        self._tag += 1
+        await self.ws.send(json.dumps({"method": "uploadInit", "args": [[]], "tag": self._tag}))
+        return await self.wait(started, self._tag)
+
+    async def wait(self, started, tag):
+        """A function to collect the outputs' new values until the server has answered request `tag` and settled. Times are in seconds after `started`."""
+
+        renders, errors = {}, {}
+        pending, running = set(), set()
+        answered = False
+        deadline = started + self.timeout
+        last = time.perf_counter()
+        while True:
+            # Hidden outputs are suspended, so they never receive the value they were waiting for.
+            quiet = answered and not (pending - self.hidden) and not running
+            wait = (min(last + self.settle, deadline) if quiet else deadline) - time.perf_counter()
+            try:
+                message = json.loads(await asyncio.wait_for(self.ws.recv(), max(wait, 0)))
+            except asyncio.TimeoutError:
+                if quiet:
+                    break
+                raise TimeoutError("outputs still pending after {}s: {}".format(self.timeout, sorted((pending - self.hidden) | running) or "no response"))
+            now = time.perf_counter()
+            if (message.get("response") or {}).get("tag") == tag:
+                answered = True
+                continue
+            if not any(message.get(key) for key in ("values", "errors", "progress", "recalculating", "custom")):
+                continue
+            last = now
+            recalculating = message.get("recalculating") or {}
+            if recalculating.get("status") == "recalculating":
+                running.add(recalculating["name"])
+            elif recalculating:
+                running.discard(recalculating["name"])
+            progress = message.get("progress") or {}
+            if progress.get("type") == "binding" and progress["message"].get("persistent"):
+                pending.add(progress["message"]["id"])
+            for name, value in (message.get("values") or {}).items():
+                renders[name] = now - started
+                self.values[name] = value
+                pending.discard(name)
+            for name, error in (message.get("errors") or {}).items():
+                errors[name] = error.get("message") if isinstance(error, dict) else error
+                renders.pop(name, None)
+                pending.discard(name)
+        return renders, errors
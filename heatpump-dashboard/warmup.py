@@ -0,0 +1,63 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Background warm-up of the heavy libraries that the dashboard imports lazily. The plotting, map and weather stacks are
+only imported by the outputs that need them, which keeps worker startup fast. With WARM_UP=1 they are imported on a
+background thread once the first session has started, so later renders do not pay for the imports either.
+
+Prophet is never imported by the server itself, only by the forecast pool's processes that fit. The warm-up starts
+those processes and imports Prophet in them instead, so the first fit pays for neither.
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+
+
+WARM_UP = os.environ.get("WARM_UP", "0") == "1"
+HEAVY_MODULES = ["ipyleaflet", "plotnine", "mizani.breaks", "matplotlib.figure", "openmeteo_requests", "requests"]
+# Modules only the forecast pool's processes need.
+POOL_MODULES = ["prophet"]
+
+logger = logging.getLogger(__name__)
+_started = threading.Event()
+import_times = {}
+
+
+def _warm_up(modules):
+    """A function to import every module in turn, recording how long each one took in `import_times`."""
+
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("Warm-up could not import %s: %s", name, e)
+            continue
+        import_times[name] = time.perf_counter() - started
+
+
+def _warm_up_pool(modules):
+    """A function to start the forecast pool's processes and import every module in them, recording the slowest process's import time per module in `import_times` as "pool:<module>"."""
+
+    from forecast import warm_pool
+
+    for name in modules:
+        try:
+            import_times["pool:" + name] = max(f.result() for f in warm_pool(name))
+        except ImportError as e:
+            logger.warning("Warm-up could not import %s in the forecast pool: %s", name, e)
+
+
+def start_warm_up(modules=HEAVY_MODULES, pool_modules=POOL_MODULES):
+    """A function to start the background warm-up the first time it is called, if WARM_UP is enabled."""
+
+    if not WARM_UP or _started.is_set():
+        return
+    _started.set()
+    threading.Thread(target=_warm_up, args=(modules,), name="warm-up", daemon=True).start()
+    threading.Thread(target=_warm_up_pool, args=(pool_modules,), name="warm-up-pool", daemon=True).start()
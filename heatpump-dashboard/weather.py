@@ -0,0 +1,175 @@
+"""
+Bhavana Sundar (bsundar3)
+CS 498 - End to End Data Science
+University of Illinois Urbana-Champaign
+
+Shared access to the OpenMeteo archive API. Every output in the dashboard needs the same daily minimum temperatures,
+so the data is loaded once per (latitude, longitude, date range) and the resulting DataFrame is reused. Downloaded days
+are kept in a local archive (see archive.py), so only days that have never been fetched are requested from the API.
+Temperatures are always requested in Celsius and converted locally, so switching units never triggers a new request.
+The dashboard loads data through `fetch_daily_async`, which runs the blocking archive reads and API requests on worker
+threads, so a slow or retrying request never stalls the other sessions on the server.
+
+The hourly mode loads hourly temperatures the same way through `fetch_hourly_async`. Hourly data is 24 times larger, so
+it is never turned into a DataFrame: it stays a float32 array straight from the API response (and then the archive's
+memory map) with the time of its first hour, and the time of any hour is computed from its index when needed.
+"""
+
+import asyncio
+import os
+from functools import lru_cache
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from archive import WeatherArchive
+from metrics import shared, span, timed
+
+
+url = os.environ.get("OPENMETEO_URL", "https://archive-api.open-meteo.com/v1/archive")
+# (connect, read) timeouts in seconds for every API request.
+REQUEST_TIMEOUT = (5, 30)
+# Pooled connections to the API, shared by all worker threads.
+MAX_CONNECTIONS = 8
+# The response cache of this process, created together with the client.
+response_cache = None
+_openmeteo = None
+_inflight = {}
+
+
+def _get_client():
+    """A function to create the OpenMeteo client on first use, so workers that only serve archived days never import the HTTP and FlatBuffers stack. The client's session answers repeated requests from the response cache (see cache.py), keeps a pool of `MAX_CONNECTIONS` connections and retries failed requests with backoff, applying `REQUEST_TIMEOUT` to every attempt."""
+
+    global _openmeteo, response_cache
+    if _openmeteo is None:
+        import openmeteo_requests
+        import requests
+        from urllib3.util.retry import Retry
+        from cache import CachingAdapter, open_cache
+
+        response_cache = open_cache()
+        session = requests.Session()
+        adapter = CachingAdapter(response_cache, REQUEST_TIMEOUT, pool_connections = MAX_CONNECTIONS, pool_maxsize = MAX_CONNECTIONS,
+                                 max_retries = Retry(total = 5, backoff_factor = 0.2, status_forcelist = [500, 502, 503, 504]))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _openmeteo = openmeteo_requests.Client(session = session)
+    return _openmeteo
+
+
+class DailyWeather(NamedTuple):
+    """The decoded archive response: the grid cell coordinates reported by OpenMeteo and the daily minimum temperatures in Celsius."""
+
+    latitude: float
+    longitude: float
+    daily: pd.DataFrame
+
+
+class HourlyWeather(NamedTuple):
+    """The hourly temperatures in Celsius for a date range, as a read-only float32 array with 24 values per day. `start` is the (UTC) datetime64 of the first hour."""
+
+    latitude: float
+    longitude: float
+    start: np.datetime64
+    temperature: np.ndarray
+
+
+@timed("openmeteo_request")
+def request_daily(lat, lng, start_date, end_date):
+    """A function to request the daily minimum temperatures (in Celsius) for a location and date range from the OpenMeteo archive API. Returns the grid cell coordinates and the float32 values, one per day."""
+
+    params = {
+        "latitude": lat,
+        "longitude": lng,
+        "start_date": start_date,
+        "end_date": end_date,
+        "daily": "temperature_2m_min",
+        "temperature_unit": "celsius",
+    }
+
+    responses = _get_client().weather_api(url, params=params)
+    response = responses[0]
+    daily = response.Daily()
+    return response.Latitude(), response.Longitude(), daily.Variables(0).ValuesAsNumpy()
+
+
+@timed("openmeteo_request")
+def request_hourly(lat, lng, start_date, end_date):
+    """A function to request the hourly temperatures (in Celsius) for a location and date range from the OpenMeteo archive API. Returns the grid cell coordinates and the float32 values, 24 per day, without decoding any timestamps."""
+
+    params = {
+        "latitude": lat,
+        "longitude": lng,
+        "start_date": start_date,
+        "end_date": end_date,
+        "hourly": "temperature_2m",
+        "temperature_unit": "celsius",
+    }
+
+    responses = _get_client().weather_api(url, params=params)
+    response = responses[0]
+    hourly = response.Hourly()
+    return response.Latitude(), response.Longitude(), hourly.Variables(0).ValuesAsNumpy()
+
+
+archive = WeatherArchive("data/archive", "temperature_2m_min", request_daily)
+hourly_archive = WeatherArchive("data/archive/hourly", "temperature_2m", request_hourly, per_day=24)
+
+
+@lru_cache(maxsize=64)
+def fetch_daily(lat, lng, start_date, end_date):
+    """A function to load the daily minimum temperatures (in Celsius) for a location and date range. Only the days missing from the local archive are downloaded. Results are memoized, so the returned DataFrame is shared and must not be modified in place."""
+
+    with span("archive_read"):
+        latitude, longitude, values = archive.read(lat, lng, start_date, end_date)
+
+    daily_dataframe = pd.DataFrame(data = {
+        "date": pd.date_range(start = start_date, periods = len(values), freq = "D").date,
+        "temperature_2m_min": values,
+    })
+
+    return shared(DailyWeather(latitude, longitude, daily_dataframe))
+
+
+@lru_cache(maxsize=16)
+def fetch_hourly(lat, lng, start_date, end_date):
+    """A function to load the hourly temperatures (in Celsius) for a location and date range. Only the days missing from the local hourly archive are downloaded. The values are a read-only view of the archive's memory map, so cached results cost almost no memory."""
+
+    with span("archive_read", resolution="hourly"):
+        latitude, longitude, values = hourly_archive.read(lat, lng, start_date, end_date)
+
+    return shared(HourlyWeather(latitude, longitude, np.datetime64(start_date, "h"), values.reshape(-1)))
+
+
+async def _load_async(fetch, lat, lng, start_date, end_date):
+    """A function to call `fetch` on a worker thread. Concurrent calls for the same data, from any session, share one load."""
+
+    key = (fetch.__name__, lat, lng, start_date, end_date)
+    load = _inflight.get(key)
+    if load is None:
+        load = asyncio.ensure_future(asyncio.to_thread(fetch, lat, lng, start_date, end_date))
+        _inflight[key] = load
+        load.add_done_callback(lambda _: _inflight.pop(key, None))
+    # A session that stops waiting must not cancel the load for the others.
+    return await asyncio.shield(load)
+
+
+async def fetch_daily_async(lat, lng, start_date, end_date):
+    """A function to load the daily minimum temperatures like `fetch_daily` without blocking the event loop: the archive read and any download run on a worker thread. Concurrent calls for the same location and date range, from any session, share one load."""
+
+    return await _load_async(fetch_daily, lat, lng, start_date, end_date)
+
+
+async def fetch_hourly_async(lat, lng, start_date, end_date):
+    """A function to load the hourly temperatures like `fetch_hourly` without blocking the event loop."""
+
+    return await _load_async(fetch_hourly, lat, lng, start_date, end_date)
+
+
+def to_units(daily_dataframe, units):
+    """A function to convert the Celsius temperatures of a daily DataFrame to the selected units. Returns the input unchanged for Celsius and a new DataFrame for Fahrenheit."""
+
+    if units == "C":
+        return daily_dataframe
+    converted = daily_dataframe.copy()
+    converted['temperature_2m_min'] = converted['temperature_2m_min'] * 9 / 5 + 32
+    return converted